@@ -0,0 +1,118 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             absorption (extinction coefficient k from IT data)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy
+#------------------------------------------------------------------------------
+
+#  table = AbsorptionTable.from_glasses(read_agf('input/ohara_2017-11-30.agf'))
+#  wl, k = table.glass(0)                        # points of one glass
+#  K = table.resample(np.arange(0.3, 2.5, 0.01)) # shape (glasses, wavelengths)
+#
+#  k = -λ ln(IT) / (4π d), with d the sample thickness (mm in the catalogs).
+#  IT = 0 means no measurable transmittance: k is undefined there (only a
+#  lower bound) and such points are left out. IT >= 1 (within the rounding of
+#  the catalog) means no measurable absorption: k = 0. The IT tables of all
+#  glasses are concatenated into flat arrays with row offsets and converted
+#  in one pass; resampling interpolates linearly within the measured range of
+#  each glass (NaN outside) using one binary search over all glasses, keyed
+#  by glass and by the rank of λ among all wavelengths (exact integers).
+
+import math
+
+import numpy as np
+
+from agf import read_catalogs
+
+
+def it_to_k(wl, IT, thickness):
+    # k at every point, NaN where undefined (IT = 0), and the defined points
+    wl, IT = np.asarray(wl, float), np.asarray(IT, float)
+    defined = IT > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = -wl/(4*math.pi) * np.log(np.minimum(IT, 1)) / (np.asarray(thickness)*1000)
+    k[IT >= 1] = 0
+    k[~defined] = np.nan
+    return k, defined
+
+
+class AbsorptionTable:
+    # IT tables of many glasses as flat arrays, glass i at offsets[i]:offsets[i+1]
+
+    def __init__(self, offsets, wl, IT, thickness, names=None):
+        self.offsets = np.asarray(offsets, np.int64)
+        self.wl = np.asarray(wl, float)
+        self.IT = np.asarray(IT, float)
+        self.thickness = np.asarray(thickness, float)
+        self.names = names
+        self.k, self.defined = it_to_k(self.wl, self.IT, self.thickness)
+
+    @classmethod
+    def from_glasses(cls, glasses):
+        glasses = list(glasses)
+        offsets = np.zeros(len(glasses)+1, np.int64)
+        offsets[1:] = np.cumsum([len(gd.wl) for gd in glasses])
+        def flat(field):
+            return np.concatenate([getattr(gd, field) for gd in glasses] + [np.zeros(0)])
+        return cls(offsets, flat('wl'), flat('IT'), flat('thickness'),
+                   [gd.name for gd in glasses])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def glass(self, row):
+        # wavelengths and k of the defined points of a glass, in catalog order
+        points = slice(self.offsets[row], self.offsets[row+1])
+        defined = self.defined[points]
+        return self.wl[points][defined], self.k[points][defined]
+
+    def resample(self, grid, fill=np.nan):
+        # k of every glass on a shared wavelength grid: (glasses, len(grid))
+        grid = np.asarray(grid, float)
+        if not self.defined.any():
+            return np.full((len(self), len(grid)), fill)
+        row = np.repeat(np.arange(len(self)), np.diff(self.offsets))[self.defined]
+        wl, k = self.wl[self.defined], self.k[self.defined]
+        order = np.lexsort((wl, row))
+        row, wl, k = row[order], wl[order], k[order]
+        start = np.searchsorted(row, np.arange(len(self)), 'left')[:, np.newaxis]
+        end = np.searchsorted(row, np.arange(len(self)), 'right')[:, np.newaxis]
+        # (row, rank of λ among all wavelengths) as one exact integer key, so
+        # all glasses share one searchsorted
+        values = np.unique(np.concatenate([wl, grid]))
+        key = row*len(values) + np.searchsorted(values, wl)
+        query = np.arange(len(self))[:, np.newaxis]*len(values) + np.searchsorted(values, grid)
+        lo = np.searchsorted(key, query, 'left')
+        hi = np.searchsorted(key, query, 'right')
+        # inside the range of its glass: a point at or below and one at or above
+        inside = (hi > start) & (lo < end)
+        last = np.maximum(end - 1, start)
+        left = np.minimum(np.clip(hi - 1, start, last), len(wl)-1)
+        right = np.minimum(np.clip(hi, start, last), len(wl)-1)
+        w0, w1 = wl[left], wl[right]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(w1 > w0, (grid - w0)/(w1 - w0), 0)
+        out = k[left] + t*(k[right] - k[left])
+        out[~inside] = fill
+        return out
+
+
+if __name__ == "__main__":
+    # timing over every glass of every catalog in input/
+    import time
+    catalogs, glasses = zip(*read_catalogs())
+    grid = np.arange(0.28, 2.5, 0.001)
+    t = time.perf_counter()
+    table = AbsorptionTable.from_glasses(glasses)
+    t_k = time.perf_counter() - t
+    t = time.perf_counter()
+    K = table.resample(grid)
+    t_resample = time.perf_counter() - t
+    print('{} glasses, {} IT points ({} with IT = 0, {} with IT >= 1): {:.1f} ms'
+          .format(len(table), len(table.wl), np.sum(table.IT == 0),
+                  np.sum(table.IT >= 1), t_k*1e3))
+    print('resampled on {} wavelengths: {:.1f} ms'.format(len(grid), t_resample*1e3))
@@ -0,0 +1,261 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             agf (streaming reader for Zemax .agf glass catalogs)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy
+#------------------------------------------------------------------------------
+
+#  for glass in read_agf('input/ohara_2017-11-30.agf'):
+#      print(glass.name, glass.nd, glass.vd)
+#  glass = read_glass('input/ohara_2017-11-30.agf', 'S-LAH79')
+#
+#  Every record is parsed completely (numbers are converted once) before it is
+#  yielded, nothing is written to disk and only one glass is held in memory.
+#  Missing numeric values ('-', absent fields, -1 resistance codes) are NaN.
+
+import os, re, glob, json, math, mmap, hashlib
+from typing import NamedTuple
+
+import numpy as np
+
+status_name = {1: 'standard', 2: 'preferred', 3: 'special', 4: 'obsolete',
+               5: 'melt'}
+
+
+class Glass(NamedTuple):
+    name: str
+    formula: int             # Zemax dispersion formula code (NM)
+    glasscode: str
+    nd: float
+    vd: float
+    exclude: int             # exclude from substitution
+    status: int              # 1:Standard, 2:Preferred, 3:Special, 4:Obsolete, 5:Melt
+    meltfreq: int            # 1(frequent) - 5(rare), 0 if unknown
+    comments: str            # GC
+    wlmin: float             # LD [μm]
+    wlmax: float
+    coefficients: np.ndarray # CD, dispersion formula coefficients
+    thermal: np.ndarray      # TD: D0 D1 D2 E0 E1 λtk Tref
+    cte1: float              # ED: thermal expansion -30C - +70C [1E-6/K]
+    cte2: float              #     thermal expansion +20C - +300C [1E-6/K]
+    density: float           #     [g/cm^3]
+    dpgf: float              #     dPgF
+    cost: float              # OD: relative cost
+    CR: float                #     climatic resistance: 1(high) - 4(low)
+    FR: float                #     stain resistance: 0(high) - 5(low)
+    SR: float                #     acid resistance: 1(high) - 4(low) and 51-53(very low)
+    AR: float                #     alkali resistance: 1(high) - 4(low)
+    PR: float                #     phosphate resistance: 1(high) - 4(low)
+    wl: np.ndarray           # IT: wavelength [μm]
+    IT: np.ndarray           #     internal transmittance
+    thickness: np.ndarray    #     sample thickness [mm]
+    nd_text: str             # NM: nd and Vd as written in the catalog
+    vd_text: str
+
+
+def digest(glass):
+    # content hash of a parsed record (all fields, arrays bit for bit)
+    h = hashlib.sha1()
+    for value in glass:
+        if isinstance(value, np.ndarray):
+            data = value.tobytes()
+        else:
+            data = repr(value).encode('utf-8')
+        h.update(b'%d:' % len(data))
+        h.update(data)
+    return h.hexdigest()
+
+
+def _float(s):
+    if s == '-':
+        return math.nan
+    return float(s)
+
+
+def _fields(data, n):
+    # the first n numbers of a record, NaN where absent
+    return [_float(s) for s in data[:n]] + [math.nan]*(n - len(data[:n]))
+
+
+def _rating(s):
+    if s == '3-4':
+        return 3.5
+    x = _float(s)
+    return math.nan if x == -1 else x
+
+
+class _Builder:
+    # collects the records of one glass until the next NM line
+
+    def __init__(self, data):
+        self.name = data[1]
+        self.formula = int(float(data[2]))
+        self.glasscode = data[3]
+        self.nd_text, self.vd_text = data[4], data[5]
+        self.nd = float(data[4])
+        self.vd = float(data[5])
+        self.exclude = int(float(data[6])) if len(data) > 6 else 0
+        self.status = int(float(data[7])) if len(data) > 7 else 0
+        if len(data) > 8 and data[8] != '-':
+            self.meltfreq = max(int(float(data[8])), 0)
+        else:
+            self.meltfreq = 0
+        self.comments = ''
+        self.wlmin = self.wlmax = math.nan
+        self.coefficients = np.zeros(0)
+        self.thermal = np.full(7, math.nan)
+        self.ed = [math.nan]*4
+        self.od = [math.nan]*6
+        self.it = []
+
+    def add(self, key, data, line):
+        if key == 'LD':
+            self.wlmin, self.wlmax = _fields(data, 2)
+        elif key == 'CD':
+            self.coefficients = np.array([float(s) for s in data])
+        elif key == 'TD':
+            self.thermal = np.array(_fields(data, 7))
+        elif key == 'ED':
+            self.ed = _fields(data, 4)
+        elif key == 'OD':
+            od = [_float(data[0]) if data else math.nan] + \
+                 [_rating(s) for s in data[1:6]]
+            self.od = od + [math.nan]*(6 - len(od))
+        elif key == 'IT':
+            if len(data) >= 3:
+                self.it.append((float(data[0]), float(data[1]), float(data[2])))
+        elif key == 'GC':
+            self.comments = line[2:].strip()
+
+    def build(self):
+        it = np.array(self.it, dtype=float).reshape(-1, 3)
+        return Glass(self.name, self.formula, self.glasscode, self.nd, self.vd,
+                     self.exclude, self.status, self.meltfreq, self.comments,
+                     self.wlmin, self.wlmax, self.coefficients, self.thermal,
+                     *self.ed, *self.od,
+                     it[:, 0].copy(), it[:, 1].copy(), it[:, 2].copy(),
+                     self.nd_text, self.vd_text)
+
+
+def parse_agf(lines, source='<agf>'):
+    # yields a Glass for every NM record of an iterable of text lines
+    glass = None
+    for lineno, line in enumerate(lines, 1):
+        data = line.split()
+        if not data:
+            continue
+        try:
+            if data[0] == 'NM':
+                if glass is not None:
+                    yield glass.build()
+                glass = _Builder(data)
+            elif glass is not None:
+                glass.add(data[0], data[1:], line)
+        except (ValueError, IndexError) as e:
+            raise ValueError('{}:{}: bad {} record ({})'
+                             .format(source, lineno, data[0], e)) from None
+    if glass is not None:
+        yield glass.build()
+
+
+def read_agf(agf_file, encoding='utf8'):
+    with open(agf_file, 'r', encoding=encoding) as agf:
+        yield from parse_agf(agf, agf_file)
+
+
+# Random access: the byte range of every NM record is indexed once and cached
+# next to the catalog in <file>.agfidx, keyed by size and mtime; one glass is
+# then parsed from an mmap slice of its own lines only.
+index_version = 1
+_nm_line = re.compile(rb'^[ \t]*NM[ \t]+(\S+)', re.M)
+_indexes = {} # path -> (key, index), for repeated lookups in one process
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def build_index(agf_file):
+    # [(name, start, end)] of every record, in file order
+    with open(agf_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            starts = [(m.group(1).decode('utf-8'), m.start())
+                      for m in _nm_line.finditer(data)]
+            size = len(data)
+    ends = [start for name, start in starts[1:]] + [size]
+    return [(name, start, end) for (name, start), end in zip(starts, ends)]
+
+
+def load_index(agf_file):
+    # name -> [(start, end), ...] (several if a catalog repeats a name)
+    path = os.path.abspath(agf_file)
+    key = _stat_key(path)
+    if path in _indexes and _indexes[path][0] == key:
+        return _indexes[path][1]
+    cache = path + '.agfidx'
+    try:
+        with open(cache, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached['version'] != index_version or cached['key'] != key:
+            raise ValueError
+        records = cached['records']
+    except (OSError, ValueError, KeyError):
+        records = build_index(path)
+        tmp = '{}.{}.tmp'.format(cache, os.getpid())
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': index_version, 'key': key,
+                           'records': records}, f)
+            os.replace(tmp, cache)
+        except OSError:
+            pass # read-only directory: the index is just not cached
+    index = {}
+    for name, start, end in records:
+        index.setdefault(name, []).append((start, end))
+    _indexes[path] = key, index
+    return index
+
+
+def read_glass(agf_file, name, encoding='utf8'):
+    # one glass (the last record of that name), without parsing the rest
+    ranges = load_index(agf_file).get(name)
+    if not ranges:
+        raise KeyError('{}: no glass {}'.format(agf_file, name))
+    start, end = ranges[-1]
+    with open(agf_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = data[start:end].decode(encoding)
+    return next(parse_agf(text.splitlines(), agf_file))
+
+
+input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'input')
+
+
+# Hikari glasses are published by Nikon
+vendor_aliases = {'hikari': 'nikon'}
+
+
+def vendor(catalog):
+    # vendor of a catalog, e.g. 'ohara' for 'ohara_2017-11-30'
+    name = catalog.split('_')[0].lower()
+    return vendor_aliases.get(name, name)
+
+
+def catalog_files(directory=input_dir):
+    return sorted(glob.glob(os.path.join(directory, '*.[aA][gG][fF]')))
+
+
+def read_catalogs(files=None):
+    # yields (catalog, Glass) for every glass of every catalog, where catalog
+    # is the file name without extension, e.g. 'ohara_2017-11-30'
+    for path in files or catalog_files():
+        catalog = os.path.splitext(os.path.basename(path))[0]
+        for glass in read_agf(path):
+            yield catalog, glass
@@ -14,7 +14,12 @@
 # CHECK AGF FILE ENCODING - CHANGE TO UTF8 IF NEEDED !!!
 #!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 
-import os, math
+import os, io, re, math, json, time, hashlib, tarfile, zipfile
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+
+from agf import read_agf, status_name
+from absorption import it_to_k
 
 agffiles = []
 ymldirs = []
@@ -48,278 +53,388 @@ agf_catalogs['cdgm'] = {'file': 'input/cdgm_2022-06.agf',
                                 '(obtained from <a href=\\"http://www.cdgmgd.com/go.htm?k=Download&url=downList\\">http://www.cdgmgd.com</a>)'+\
                                 '<br>See also <a href=\\"https://refractiveindex.info/download/data/2022/CDGM202206.pdf\\">CDGM optical glass data sheets</a>'}
 
-class GlassData:
-    wl = None
-    IT = None
-    thickness = None
-    
-    name = ''
-    comments = ''
-    formula = 0
-    glasscode = ''
-    nd = 0
-    vd = 0
-    status = 0 # 1:Standard, 2:Preferred, 3:Special, 4:Obsolete, 5:Melt
-    meltfreq = 0
- 
-    wlmin = 0
-    wlmax = 0
-
-    disp_formula_coefficients = ''
-
-    thermal_disp_coefficients = ''
-
-    cte1 = '-' #coefficient of termal expansion -30C - +70C [1E-6/K]
-    cte2 = '-' #coefficient of termal expansion +20C - +300C [1E-6/K]
-    density = '-' # [g/cm^3]
-    dpgf = '-' #dPgF
-
-    CR = '-' # Climatic resistance: 1(high) - 4(low)
-    FR = '-' # Stain resistance: 0(high) - 5(low)
-    SR = '-' # Acid resistance: 1(high) - 4(low) and 51-53(very low)
-    AR = '-' # Alkali resistance: 1(high) - 4(low)
-    PR = '-' # Phosphate resistance: 1(high) - 4(low)
-    def __init__(self):
-        self.wl, self.IT, self.thickness = [],[],[]
-
-
-def WriteYML(gd, ymldir, references, glass_count): 
-    print('{}: {}'.format(glass_count, gd.name))
-    yml_file_path = os.path.join(ymldir, gd.name.replace('*','star'))
-    ymlfile = open('{}.yml'.format(yml_file_path), 'w+', encoding='utf-8')
-
-    ymlfile.write("# this file is part of refractiveindex.info database\n# refractiveindex.info database is in the public domain\n# copyright and related rights waived via CC0 1.0\n\n")
-    ymlfile.write('REFERENCES: "' + references + '"\n')
+def given(x):
+    # value present in the catalog and non-zero
+    return not math.isnan(x) and x != 0
+
+
+# exponents of the polynomial formulas (None: constant term)
+polynomial_powers = {1: [None, 2, -2, -4, -6, -8],
+                     11: [None, 2, -2, -4, -6, -8, -10, -12],
+                     12: [None, 2, -2, -4, -6, -8, 4, 6],
+                     13: [None, 2, 4, -2, -4, -6, -8, -10, -12]}
+
+header = "# this file is part of refractiveindex.info database\n# refractiveindex.info database is in the public domain\n# copyright and related rights waived via CC0 1.0\n\n"
+
+
+def absorption(gd):
+    # tabulated k from internal transmittance, IT=0 points are skipped
+    k, defined = it_to_k(gd.wl, gd.IT, gd.thickness)
+    return gd.wl[defined], k[defined]
+
+
+def RenderYML(gd, references):
+    out = [header, 'REFERENCES: "', references, '"\n']
+    w = out.append
     
     if gd.comments:
-        if gd.comments != '':
-            ymlfile.write('COMMENTS: "' + gd.comments + '"\n')
+        w('COMMENTS: "' + gd.comments + '"\n')
     
-    ymlfile.write('DATA:\n')
-
-    if gd.formula == "1":
-        ymlfile.write('  - type: formula 3 \n')
-        ymlfile.write('    range: {} {}\n'.format(float(gd.wlmin), float(gd.wlmax)))
-        ymlfile.write('    coefficients:')
-        coeff_list = [None, 2, -2, -4, -6, -8]
-        n_coeffs = len(gd.disp_formula_coefficients)
-        for i, k in zip(range(n_coeffs), coeff_list[:n_coeffs]):
-            if float(gd.disp_formula_coefficients[i]):
-                ymlfile.write(' {}'.format(float(gd.disp_formula_coefficients[i]), k))
-                if k != None:
-                    ymlfile.write(' {}'.format(k))
+    w('DATA:\n')
+
+    coefficients = gd.coefficients
+    n_coeffs = len(coefficients)
+
+    if gd.formula in polynomial_powers:
+        w('  - type: formula 3 \n')
+        # the historical key for extended formula 3, kept for compatibility
+        key = 'wavelength_range' if gd.formula == 13 else 'range'
+        w('    {}: {} {}\n'.format(key, gd.wlmin, gd.wlmax))
+        w('    coefficients:')
+        for c, k in zip(coefficients, polynomial_powers[gd.formula]):
+            if c:
+                w(' {}'.format(c) if k is None else ' {} {}'.format(c, k))
                     
-    elif gd.formula == "2" or gd.formula == "6":
-        ymlfile.write('  - type: formula 2 \n')
-        ymlfile.write('    range: {} {}\n'.format(float(gd.wlmin), float(gd.wlmax)))
-        ymlfile.write('    coefficients:')
-        ymlfile.write(' 0')
-        n_coeff = len(gd.disp_formula_coefficients) 
+    elif gd.formula == 2 or gd.formula == 6:
+        w('  - type: formula 2 \n')
+        w('    range: {} {}\n'.format(gd.wlmin, gd.wlmax))
+        w('    coefficients: 0')
         for i in range(0, 16, 2):
-            if n_coeff > i+1 and float(gd.disp_formula_coefficients[i]):
-                ymlfile.write(' {} {}'.format(float(gd.disp_formula_coefficients[i]),
-                                              float(gd.disp_formula_coefficients[i+1])))
+            if n_coeffs > i+1 and coefficients[i]:
+                w(' {} {}'.format(coefficients[i], coefficients[i+1]))
                 
-    elif gd.formula == "3":
-        ymlfile.write('  - type: formula 4 \n')
-        ymlfile.write('    range: {} {}\n'.format(float(gd.wlmin), float(gd.wlmax)))
-        ymlfile.write('    coefficients:')
-        n_coeffs = len(gd.disp_formula_coefficients)
-        ymlfile.write(' {} {} 2 {} 2 {} 0 {} 2'.format(float(gd.disp_formula_coefficients[0])+1,
-                                                       float(gd.disp_formula_coefficients[1]),
-                                                       float(gd.disp_formula_coefficients[2]),
-                                                       float(gd.disp_formula_coefficients[3]),
-                                                       float(gd.disp_formula_coefficients[4])))
-    elif gd.formula == "11":
-        ymlfile.write('  - type: formula 3 \n')
-        ymlfile.write('    range: {} {}\n'.format(float(gd.wlmin), float(gd.wlmax)))
-        ymlfile.write('    coefficients:')
-        coeff_list = [None, 2, -2, -4, -6, -8, -10, -12]
-        n_coeffs = len(gd.disp_formula_coefficients)
-        for i, k in zip(range(n_coeffs), coeff_list[:n_coeffs]):
-            if float(gd.disp_formula_coefficients[i]):
-                ymlfile.write(' {}'.format(float(gd.disp_formula_coefficients[i]), k))
-                if k != None:
-                    ymlfile.write(' {}'.format(k))
-    
-    elif gd.formula == "12":
-        ymlfile.write('  - type: formula 3 \n')
-        ymlfile.write('    range: {} {}\n'.format(float(gd.wlmin), float(gd.wlmax)))
-        ymlfile.write('    coefficients:')
-        coeff_list = [None, 2, -2, -4, -6, -8, 4, 6]
-        n_coeffs = len(gd.disp_formula_coefficients)
-        for i, k in zip(range(n_coeffs), coeff_list[:n_coeffs]):
-            if float(gd.disp_formula_coefficients[i]):
-                ymlfile.write(' {}'.format(float(gd.disp_formula_coefficients[i]), k))
-                if k != None:
-                    ymlfile.write(' {}'.format(k))
+    elif gd.formula == 3:
+        w('  - type: formula 4 \n')
+        w('    range: {} {}\n'.format(gd.wlmin, gd.wlmax))
+        w('    coefficients: {} {} 2 {} 2 {} 0 {} 2'.format(coefficients[0]+1,
+                                                          *coefficients[1:5]))
+    w('\n')
     
-    elif gd.formula == "13":
-        ymlfile.write('  - type: formula 3 \n')
-        ymlfile.write('    wavelength_range: {} {}\n'.format(float(gd.wlmin), float(gd.wlmax)))
-        ymlfile.write('    coefficients:')
-        coeff_list = [None, 2, 4, -2, -4, -6, -8, -10, -12]
-        n_coeffs = len(gd.disp_formula_coefficients)
-        for i, k in zip(range(n_coeffs), coeff_list[:n_coeffs]):
-            if float(gd.disp_formula_coefficients[i]):
-                ymlfile.write(' {}'.format(float(gd.disp_formula_coefficients[i]), k))
-                if k != None:
-                    ymlfile.write(' {}'.format(k))
-                
-    ymlfile.write('\n')
+    w('  - type: tabulated k\n')
+    w('    data: |\n')
+    w(''.join(map('        {:.3f} {:.4E}\n'.format, *absorption(gd))))
     
-    ymlfile.write('  - type: tabulated k\n')
-    ymlfile.write('    data: |\n')  
-    for i in range (0, len(gd.wl)):
-        if float(gd.IT[i]) != 0:
-            k = -float(gd.wl[i]) / (4*math.pi) * \
-                math.log(float(gd.IT[i])) / (float(gd.thickness[i])*1000)
-            ymlfile.write('        {:.3f} {:.4E}\n'.format(float(gd.wl[i]), k))
-    
-    ymlfile.write('SPECS:\n')
-    ymlfile.write('    n_absolute: false\n')
-    ymlfile.write('    wavelength_vacuum: false\n')
-    if len(gd.thermal_disp_coefficients) > 6 and gd.thermal_disp_coefficients[6] != '':
-        ymlfile.write('    temperature: {:.1f} ℃\n'.format(float(gd.thermal_disp_coefficients[6])))
-    if len(gd.thermal_disp_coefficients) > 5 and \
-            gd.thermal_disp_coefficients[0] != '' and \
-            gd.thermal_disp_coefficients[1] != '' and \
-            gd.thermal_disp_coefficients[2] != '' and \
-            gd.thermal_disp_coefficients[3] != '' and \
-            gd.thermal_disp_coefficients[4] != '' and \
-            gd.thermal_disp_coefficients[5] != '' and \
-            (float(gd.thermal_disp_coefficients[0]) or
-             float(gd.thermal_disp_coefficients[1]) or
-             float(gd.thermal_disp_coefficients[2]) or
-             float(gd.thermal_disp_coefficients[3]) or
-             float(gd.thermal_disp_coefficients[4]) or
-             float(gd.thermal_disp_coefficients[5])): 
-        ymlfile.write('    thermal_dispersion:\n' +
-                      '      - type: "Schott formula"\n' +
-                      '        coefficients: {}\n'
-                      .format(' '.join([format(float(gd.thermal_disp_coefficients[i]))
-                                        for i in range(6) ]))) 
-    ymlfile.write('    nd: {}\n'.format(gd.nd))
-    ymlfile.write('    Vd: {}\n'.format(gd.vd))
+    w('SPECS:\n')
+    w('    n_absolute: false\n')
+    w('    wavelength_vacuum: false\n')
+    td = gd.thermal
+    if not math.isnan(td[6]):
+        w('    temperature: {:.1f} ℃\n'.format(td[6]))
+    if not numpy.isnan(td[:6]).any() and td[:6].any():
+        w('    thermal_dispersion:\n' +
+          '      - type: "Schott formula"\n' +
+          '        coefficients: {}\n'.format(' '.join(map(format, td[:6]))))
+    w('    nd: {}\n'.format(gd.nd_text))
+    w('    Vd: {}\n'.format(gd.vd_text))
     if float(gd.glasscode) > 100000:
-        ymlfile.write('    glass_code: {}\n'.format(gd.glasscode))
+        w('    glass_code: {}\n'.format(gd.glasscode))
     
-    status_name = {1:'standard', 2:'preferred', 3:'special', 4:'obsolete',
-                   5:'melt'}
-    for num, desc in status_name.items():
-        if int(float(gd.status)) == num:
-             ymlfile.write('    glass_status: {}\n'.format(desc))
-
-    if gd.meltfreq != '' and gd.meltfreq != 0:
-        ymlfile.write('    glass_melt_frequency: {}\n'.format(gd.meltfreq))
-    if gd.density != '' and gd.density != '-' and float(gd.density):
-        ymlfile.write('    density: {} g/cm<sup>3</sup>\n'.format(float(gd.density)))
-
-    if (gd.cte1 != '' and gd.cte1 != '-' and float(gd.cte1)) or (gd.cte2 != '' and gd.cte2 != '-' and float(gd.cte2)):
-        ymlfile.write('    thermal_expansion:\n')
-                     
-    if gd.cte1 != '' and gd.cte1 != '-' and float(gd.cte1): #-30...70 C
-        ymlfile.write('      - temperature_range: -30 70 ℃\n' +
-                      '        coefficient: {} K<sup>-1</sup>\n'
-                      .format(round(float(gd.cte1)*1.0e-6,15)))
-                     
-    if gd.cte2 != '' and gd.cte2 != '-' and float(gd.cte2): #20...300 C
-        ymlfile.write('      - temperature_range: 20 300 ℃\n' +
-                      '        coefficient: {} K<sup>-1</sup>\n'
-                      .format(round(float(gd.cte2)*1.0e-6,15)))
+    if gd.status in status_name:
+        w('    glass_status: {}\n'.format(status_name[gd.status]))
+
+    if gd.meltfreq:
+        w('    glass_melt_frequency: {}\n'.format(gd.meltfreq))
+    if given(gd.density):
+        w('    density: {} g/cm<sup>3</sup>\n'.format(gd.density))
+
+    if given(gd.cte1) or given(gd.cte2):
+        w('    thermal_expansion:\n')
+    if given(gd.cte1): #-30...70 C
+        w('      - temperature_range: -30 70 ℃\n' +
+          '        coefficient: {} K<sup>-1</sup>\n'.format(round(gd.cte1*1.0e-6,15)))
+    if given(gd.cte2): #20...300 C
+        w('      - temperature_range: 20 300 ℃\n' +
+          '        coefficient: {} K<sup>-1</sup>\n'.format(round(gd.cte2*1.0e-6,15)))
                      
-    if gd.dpgf != '' and gd.dpgf != '-' and float(gd.dpgf):
-        ymlfile.write('    dPgF: {}\n'.format(float(gd.dpgf)))
-    if gd.CR != '' and gd.CR != '-' and float(gd.CR) != -1:
-        ymlfile.write('    climatic_resistance: {}\n'.format(float(gd.CR)))
-    if gd.FR != '' and gd.FR != '-' and float(gd.FR) != -1:
-        ymlfile.write('    stain_resistance: {}\n'.format(float(gd.FR)))
-    if gd.SR != '' and gd.SR != '-' and float(gd.SR) != -1:
-        ymlfile.write('    acid_resistance: {}\n'.format(float(gd.SR)))
-    if gd.AR != '' and gd.AR != '-' and float(gd.AR) != -1:
-        ymlfile.write('    alkali_resistance: {}\n'.format(float(gd.AR)))
-    if gd.PR != '' and gd.PR != '-' and float(gd.PR) != -1:
-        ymlfile.write('    phosphate_resistance: {}\n'.format(float(gd.PR)))
-
-    ymlfile.close()
-    
-    print('ok')
-
-def process(agf_file, out_dir, ref):
-    glass_count = 0
-    gd = GlassData()
-    with open(agf_file,'r',encoding='utf8') as agf:
-        for line in agf:
-            data = [k.strip() for k in line.split(" ")]
-            if not len(data):
-                continue
-            if data[0] == 'NM':
-                if glass_count!=0:
-                    WriteYML(gd, out_dir, ref, glass_count)
-                    #sys.exit(0)
-                glass_count +=1
-                gd = GlassData()
-                gd.name = data[1]
-                
-                gd.formula = data[2]
-                gd.glasscode = data[3]
-                gd.nd = data[4]
-                gd.vd = data[5]
-                if len(data) >= 8: gd.status = data[7] 
-                if len(data) >= 9 and data.count('-') < 0: gd.meltfreq = data[8]
-                else: gd.meltfreq = 0
-                continue
-            if data[0] == 'LD':
-                gd.wlmin = data[1]
-                gd.wlmax = data[2]
-                continue
-            if data[0] == 'CD':
-                gd.disp_formula_coefficients = data[1:]
-                continue
-            if data[0] == 'TD':
-                gd.thermal_disp_coefficients = data[1:]
-                continue
-            if data[0] == 'ED':
-                gd.cte1 = data[1]
-                gd.cte2 = data[2]
-                gd.density = data[3]
-                gd.dpgf = data[4]
-                continue
-            if data[0] == 'OD':
-                #? = data[1]
-                if len(data)>2:
-                    gd.CR = data[2]
-                    if gd.CR == '3-4':
-                        gd.CR = '3.5'
-                    gd.FR = data[3]
-                    gd.SR = data[4]
-                    gd.AR = data[5]
-                    gd.PR = data[6]
-                continue
-            if data[0] == 'IT' and data[1]!='' and data[2]!='' and data[3]!='':
-                gd.wl.append(data[1])
-                gd.IT.append(data[2])
-                gd.thickness.append(data[3])
-                continue
-            if data[0] == 'GC':
-##                gd.comments = data[1:]
-                gd.comments = ' '.join(data[1:])
-
-        if glass_count!=0:
-            WriteYML(gd, out_dir, ref, glass_count)
+    if given(gd.dpgf):
+        w('    dPgF: {}\n'.format(gd.dpgf))
+    if not math.isnan(gd.CR):
+        w('    climatic_resistance: {}\n'.format(gd.CR))
+    if not math.isnan(gd.FR):
+        w('    stain_resistance: {}\n'.format(gd.FR))
+    if not math.isnan(gd.SR):
+        w('    acid_resistance: {}\n'.format(gd.SR))
+    if not math.isnan(gd.AR):
+        w('    alkali_resistance: {}\n'.format(gd.AR))
+    if not math.isnan(gd.PR):
+        w('    phosphate_resistance: {}\n'.format(gd.PR))
+
+    return ''.join(out)
+
+
+def write_file(path, text):
+    # the whole file goes out in one write() to a temporary name next to the
+    # target, which is then renamed over it: readers never see partial files
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(text.encode('utf-8'))
+    os.replace(tmp, path)
+
+
+# characters kept in file names; '*' becomes 'star', anything else '_'
+unsafe_chars = re.compile(r'[^A-Za-z0-9()+._-]')
+reserved_names = {'CON', 'PRN', 'AUX', 'NUL'} | \
+                 {'COM%d' % i for i in range(1, 10)} | {'LPT%d' % i for i in range(1, 10)}
+
+
+def safe_name(name):
+    # a glass name usable as a file name on every platform and in archives
+    name = unsafe_chars.sub('_', name.replace('*', 'star'))
+    if not name or name.startswith('.'):
+        name = '_' + name
+    if name.split('.')[0].upper() in reserved_names:
+        name += '_'
+    return name
+
+
+def yml_name(name):
+    return safe_name(name) + '.yml'
+
+
+def WriteYML(gd, ymldir, references, glass_count, verbose=False): 
+    if verbose:
+        print('{}: {}'.format(glass_count, gd.name))
+    write_file(os.path.join(ymldir, yml_name(gd.name)), RenderYML(gd, references))
+
+
+# In-memory conversion: documents() renders a stream of glasses without
+# touching the disk, convert_stream() hands the documents to a sink.
+
+def documents(glasses, references, parse=False):
+    # yields (file name, YAML text), or (file name, dict) with parse=True;
+    # a name repeated in the stream is yielded once, with its last record
+    latest = {gd.name: gd for gd in glasses}
+    if parse:
+        import yaml
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    for name, gd in latest.items():
+        text = RenderYML(gd, references)
+        yield yml_name(name), yaml.load(text, loader) if parse else text
+
+
+class Sink:
+    # base of the sinks below, which receive documents through
+    # write(name, text), name possibly containing '/'; any object with a
+    # write method will do for convert_stream()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DirectorySink(Sink):
+    # every document becomes a file below a directory
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, name, text):
+        path = os.path.join(self.path, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, text)
+
+
+class ArchiveSink(Sink):
+    # documents go into a .zip or a .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz archive
+
+    def __init__(self, path):
+        if path.lower().endswith('.zip'):
+            self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            compression = {'.gz': 'gz', '.tgz': 'gz', '.bz2': 'bz2', '.xz': 'xz'}
+            ext = os.path.splitext(path)[1].lower()
+            self.archive = tarfile.open(path, 'w:' + compression.get(ext, ''))
+
+    def write(self, name, text):
+        data = text.encode('utf-8')
+        if isinstance(self.archive, zipfile.ZipFile):
+            self.archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size, info.mtime = len(data), time.time()
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+
+class CallbackSink(Sink):
+    # every document is passed to callback(name, text)
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, name, text):
+        self.callback(name, text)
+
+
+def convert_stream(glasses, references, sink, prefix=''):
+    # renders every glass into the sink (as prefix/name if given), returns
+    # the number of documents
+    count = 0
+    for name, text in documents(glasses, references):
+        sink.write(prefix + '/' + name if prefix else name, text)
+        count += 1
+    return count
+
+
+# Incremental conversion: every output directory keeps a manifest with a hash
+# of the rendered document of each glass (references included). Glasses whose
+# document did not change (and whose file is still there) are not written
+# again, so catalog fields that are not rendered (cost, exclude) do not count.
+manifest_name = '.agf2yml-manifest.json'
+manifest_version = 3 # bump whenever what is hashed changes
+
+
+def document_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, manifest_name), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != manifest_version:
+        return None
+    return manifest['glasses']
+
+
+def plan(rendered, out_dir, force=False):
+    # Takes (glass name, YAML text) pairs and returns the documents that have
+    # to be written, the new manifest and the change report. A name repeated
+    # in a catalog is written once, with its last record, as in a sequential
+    # conversion.
+    old = None if force else load_manifest(out_dir)
+    latest = dict(rendered)
+    manifest, todo = {}, []
+    changes = {'added': [], 'modified': [], 'removed': [], 'unchanged': 0,
+               'initial': old is None}
+    old = old or {}
+    for name, text in latest.items():
+        manifest[name] = document_hash(text)
+        if name not in old:
+            changes['added'].append(name)
+        elif old[name] != manifest[name] or \
+                not os.path.exists(os.path.join(out_dir, yml_name(name))):
+            changes['modified'].append(name)
+        else:
+            changes['unchanged'] += 1
+            continue
+        todo.append((name, text))
+    changes['removed'] = [name for name in old if name not in latest]
+    return todo, manifest, changes
+
+
+def commit(out_dir, manifest, changes):
+    # drops files of glasses that left the catalog and saves the manifest
+    for name in changes['removed']:
+        path = os.path.join(out_dir, yml_name(name))
+        if os.path.exists(path):
+            os.remove(path)
+    write_file(os.path.join(out_dir, manifest_name),
+               json.dumps({'version': manifest_version, 'glasses': manifest},
+                          indent=0, sort_keys=True))
+
+
+def report(label, out_dir, changes):
+    print('{}: {} added, {} modified, {} removed, {} unchanged in {}'
+          .format(label, len(changes['added']), len(changes['modified']),
+                  len(changes['removed']), changes['unchanged'], out_dir))
+    if not changes['initial']:
+        for mark, key in (('+', 'added'), ('~', 'modified'), ('-', 'removed')):
+            for name in changes[key]:
+                print('  {} {}'.format(mark, name))
+
+
+def write_documents(todo, out_dir, verbose=False):
+    for glass_count, (name, text) in enumerate(todo, 1):
+        if verbose:
+            print('{}: {}'.format(glass_count, name))
+        write_file(os.path.join(out_dir, yml_name(name)), text)
+
+
+def process(agf_file, out_dir, ref, verbose=False, force=False):
+    rendered = ((gd.name, RenderYML(gd, ref)) for gd in read_agf(agf_file))
+    todo, manifest, changes = plan(rendered, out_dir, force)
+    write_documents(todo, out_dir, verbose)
+    commit(out_dir, manifest, changes)
+    report(agf_file, out_dir, changes)
+    return changes
+
+def render_chunk(job):
+    glasses, ref = job
+    return [(gd.name, RenderYML(gd, ref)) for gd in glasses]
+
+def convert(names, workers=None, chunksize=32, force=False):
+    # Converts several catalogs at once. Catalogs are parsed here, in order,
+    # and their glasses are rendered in the process pool in chunks, so large
+    # catalogs are spread over all workers as well; only the documents whose
+    # hash changed are then written.
+    jobs, owner = [], []
+    for name in names:
+        catalog = agf_catalogs[name]
+        os.makedirs(catalog['dir'], exist_ok=True)
+        print('{}: {} -> {}'.format(name, catalog['file'], catalog['dir']))
+        glasses = list(read_agf(catalog['file']))
+        for start in range(0, len(glasses), chunksize):
+            jobs.append((glasses[start:start+chunksize], catalog['refs']))
+            owner.append(name)
+    rendered = {name: [] for name in names}
+    if jobs:
+        with ProcessPoolExecutor(workers) as pool:
+            for name, documents in zip(owner, pool.map(render_chunk, jobs)):
+                rendered[name].extend(documents)
+    written = {}
+    for name in names:
+        out_dir = agf_catalogs[name]['dir']
+        todo, manifest, changes = plan(rendered[name], out_dir, force)
+        write_documents(todo, out_dir)
+        written[name] = len(todo)
+        commit(out_dir, manifest, changes)
+        report(name, out_dir, changes)
+    return written
 
 ### main program
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print("Usage: python {} <catalog name>".format(__file__))
-        print("Catalog name can be one of the following: ")
-        for name in agf_catalogs.keys():
-            print("{} ".format(name))
-        sys.exit(1)
-    catalog = agf_catalogs[sys.argv[1]]
-    # Make output dir
-    if not os.path.exists(catalog['dir']):
-        os.mkdir(catalog['dir'])
-    process(catalog['file'], catalog['dir'], catalog['refs'])
-    
+    import argparse
+    parser = argparse.ArgumentParser(description="""
+                                     Converts Zemax .agf catalogs into
+                                     refractiveindex.info YAML files.
+                                     """)
+    parser.add_argument('catalogs', nargs='+', metavar='catalog',
+                        choices=list(agf_catalogs) + ['all'],
+                        help='catalog name, several names or "all"')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print a progress line per glass')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='rewrite all files, ignoring the manifest')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('-a', '--archive', default=None,
+                        help='write a .zip or .tar[.gz] archive instead of output/')
+    args = parser.parse_args()
+
+    names = list(agf_catalogs) if 'all' in args.catalogs else \
+            list(dict.fromkeys(args.catalogs))
+    if args.archive:
+        with ArchiveSink(args.archive) as sink:
+            for name in names:
+                catalog = agf_catalogs[name]
+                count = convert_stream(read_agf(catalog['file']), catalog['refs'],
+                                       sink, os.path.basename(catalog['dir']))
+                print('{}: {} glasses -> {}'.format(name, count, args.archive))
+    elif len(names) == 1:
+        catalog = agf_catalogs[names[0]]
+        # Make output dir
+        os.makedirs(catalog['dir'], exist_ok=True)
+        process(catalog['file'], catalog['dir'], catalog['refs'],
+                verbose=not args.quiet, force=args.force)
+    else:
+        convert(names, args.jobs, force=args.force)
@@ -0,0 +1,119 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             agfdiff (differences between two versions of a catalog)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy
+#------------------------------------------------------------------------------
+
+#  usage: python agfdiff.py schott                  (two latest schott_* files in input/)
+#         python agfdiff.py old.agf new.agf
+#
+#  Glasses are matched by name. Besides added and removed glasses and changes
+#  of status, formula and LD range, the largest |Δn| of every common glass is
+#  reported: old and new formulas are evaluated on `samples` wavelengths
+#  spanning the overlap of the old and new LD ranges, all glasses at once on
+#  one (glasses x samples) grid per catalog.
+
+import os
+
+import numpy as np
+
+from agf import read_agf, catalog_files, digest, status_name
+from dispersion import DispersionTable
+
+samples = 256
+
+
+def diff(old, new, samples=samples):
+    # old, new: iterables of Glass; returns a dict of lists of names and
+    # the max |Δn| array of the common glasses
+    old = {gd.name: gd for gd in old}
+    new = {gd.name: gd for gd in new}
+    common = [name for name in new if name in old]
+    result = {'added': [name for name in new if name not in old],
+              'removed': [name for name in old if name not in new],
+              'common': common,
+              'modified': [name for name in common
+                           if digest(old[name]) != digest(new[name])],
+              'status': [name for name in common
+                         if old[name].status != new[name].status],
+              'formula': [name for name in common
+                          if old[name].formula != new[name].formula],
+              'range': [name for name in common
+                        if (old[name].wlmin, old[name].wlmax)
+                        != (new[name].wlmin, new[name].wlmax)]}
+    a = DispersionTable.from_glasses(old[name] for name in common)
+    b = DispersionTable.from_glasses(new[name] for name in common)
+    lo = np.fmax(a.wlmin, b.wlmin)[:, np.newaxis]
+    hi = np.fmin(a.wlmax, b.wlmax)[:, np.newaxis]
+    wl = lo + (hi - lo)*np.linspace(0, 1, samples)[np.newaxis, :]
+    dn = np.abs(b.n(wl, mask=False) - a.n(wl, mask=False))
+    with np.errstate(invalid='ignore'):
+        dn[(hi <= lo)[:, 0]] = np.nan # no overlap
+        result['dn'] = np.nanmax(dn, axis=1, initial=-np.inf)
+    result['dn'][~np.isfinite(result['dn'])] = np.nan
+    result['old'], result['new'] = old, new
+    return result
+
+
+def versions(vendor):
+    # the two latest catalog files of a vendor in input/
+    files = [path for path in catalog_files()
+             if os.path.basename(path).lower().startswith(vendor.lower() + '_')]
+    if len(files) < 2:
+        raise ValueError('need two catalogs of {}, found {}'.format(vendor, len(files)))
+    return files[-2:]
+
+
+if __name__ == "__main__":
+    import argparse, time
+    parser = argparse.ArgumentParser(description="""
+                                     Compares two versions of a Zemax glass
+                                     catalog.
+                                     """)
+    parser.add_argument('catalogs', nargs='+',
+                        help='vendor name (e.g. schott) or two .agf files')
+    parser.add_argument('-t', '--threshold', type=float, default=1e-5,
+                        help='list glasses with max |Δn| above this (default: 1e-5)')
+    args = parser.parse_args()
+    if len(args.catalogs) == 1:
+        old_file, new_file = versions(args.catalogs[0])
+    elif len(args.catalogs) == 2:
+        old_file, new_file = args.catalogs
+    else:
+        parser.error('give a vendor name or two files')
+
+    t = time.perf_counter()
+    d = diff(read_agf(old_file), read_agf(new_file))
+    t = time.perf_counter() - t
+    old, new = d['old'], d['new']
+    print('{} -> {}'.format(old_file, new_file))
+    print('{} glasses -> {}: {} added, {} removed, {} modified'
+          .format(len(old), len(new), len(d['added']), len(d['removed']),
+                  len(d['modified'])))
+    if d['added']:
+        print('added:   ' + ' '.join(d['added']))
+    if d['removed']:
+        print('removed: ' + ' '.join(d['removed']))
+    for name in d['status']:
+        print('status   {:16s} {} -> {}'
+              .format(name, status_name.get(old[name].status, old[name].status),
+                      status_name.get(new[name].status, new[name].status)))
+    for name in d['formula']:
+        print('formula  {:16s} {} -> {}'
+              .format(name, old[name].formula, new[name].formula))
+    for name in d['range']:
+        print('range    {:16s} {:.4f}-{:.4f} -> {:.4f}-{:.4f} μm'
+              .format(name, old[name].wlmin, old[name].wlmax,
+                      new[name].wlmin, new[name].wlmax))
+    dn = d['dn']
+    for i in np.argsort(-np.nan_to_num(dn, nan=np.inf), kind='stable'):
+        if np.isnan(dn[i]):
+            print('max |Δn| {:16s} no common wavelength range'.format(d['common'][i]))
+        elif dn[i] > args.threshold:
+            print('max |Δn| {:16s} {:.2e}'.format(d['common'][i], dn[i]))
+    print('compared in {:.3f} s'.format(t))
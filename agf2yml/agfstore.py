@@ -0,0 +1,229 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             agfstore (compiled, memory-mapped snapshot of all catalogs)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy
+#------------------------------------------------------------------------------
+
+#  usage: python agfstore.py compile            (input/*.agf -> glasses.agfstore)
+#         python agfstore.py N-BK7 S-LAH79      (look glasses up in the store)
+#
+#  store = GlassStore('glasses.agfstore')
+#  row = store.find('S-LAH79', 'ohara')
+#  n = store.dispersion().n(wl)[row]
+#
+#  File layout: 8-byte magic, little-endian uint32 format version, uint32
+#  header length, a JSON header (catalog files, and dtype/shape/offset of
+#  every array) and the arrays themselves, 64-byte aligned. Opening the store
+#  reads only the header; all arrays are views into one read-only np.memmap,
+#  so nothing is parsed and processes opening the same file share its pages.
+#  Strings (names, glass codes, comments) are UTF-8 blobs with offset tables;
+#  names also have a sorted copy for binary search.
+
+import os, json, struct
+
+import numpy as np
+
+from agf import Glass, read_catalogs, catalog_files
+from dispersion import DispersionTable, ncoefficients
+
+magic = b'AGFSTORE'
+store_version = 2
+default_store = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'glasses.agfstore')
+
+
+def _strings(values):
+    # UTF-8 blob and offsets of a list of strings
+    data = [v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(data)+1, np.int64)
+    offsets[1:] = np.cumsum([len(d) for d in data])
+    return np.frombuffer(b''.join(data), np.uint8), offsets
+
+
+def _catalog_key(files):
+    return [[os.path.abspath(p), os.stat(p).st_size, os.stat(p).st_mtime_ns]
+            for p in files]
+
+
+def compile_store(files=None, path=default_store):
+    files = files or catalog_files()
+    catalogs, glasses = [], []
+    for catalog, gd in read_catalogs(files):
+        catalogs.append(catalog)
+        glasses.append(gd)
+    N = len(glasses)
+    catalog_names = sorted(set(catalogs), key=catalogs.index)
+    C = np.zeros((N, ncoefficients))
+    for i, gd in enumerate(glasses):
+        C[i, :len(gd.coefficients)] = gd.coefficients[:ncoefficients]
+    arrays = {
+        'catalog': np.array([catalog_names.index(c) for c in catalogs], np.int16),
+        'formula': np.array([gd.formula for gd in glasses], np.int16),
+        'ncoefficients': np.array([len(gd.coefficients) for gd in glasses], np.int16),
+        'coefficients': C,
+        'range': np.array([(gd.wlmin, gd.wlmax) for gd in glasses]).reshape(N, 2),
+        'ndvd': np.array([(gd.nd, gd.vd) for gd in glasses]).reshape(N, 2),
+        'codes': np.array([(gd.exclude, gd.status, gd.meltfreq)
+                           for gd in glasses], np.int16).reshape(N, 3),
+        'thermal': np.array([gd.thermal for gd in glasses]).reshape(N, 7),
+        'ed': np.array([(gd.cte1, gd.cte2, gd.density, gd.dpgf)
+                        for gd in glasses]).reshape(N, 4),
+        'od': np.array([(gd.cost, gd.CR, gd.FR, gd.SR, gd.AR, gd.PR)
+                        for gd in glasses]).reshape(N, 6),
+        'it_offsets': np.concatenate([[0], np.cumsum([len(gd.wl) for gd in glasses])]),
+        'it': np.concatenate([np.column_stack((gd.wl, gd.IT, gd.thickness))
+                              for gd in glasses] + [np.zeros((0, 3))]),
+    }
+    for field in ('name', 'glasscode', 'comments', 'nd_text', 'vd_text'):
+        arrays[field + '_blob'], arrays[field + '_offsets'] = \
+            _strings([getattr(gd, field) for gd in glasses])
+    names = np.array([gd.name.encode('utf-8') for gd in glasses])
+    order = np.argsort(names, kind='stable')
+    arrays['name_sorted'], arrays['name_order'] = names[order], order.astype(np.int32)
+
+    header = {'version': store_version, 'files': _catalog_key(files),
+              'catalogs': catalog_names, 'arrays': {}}
+    offset = 0
+    for key, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        arrays[key] = a
+        header['arrays'][key] = {'dtype': a.dtype.str, 'shape': a.shape,
+                                 'offset': offset}
+        offset += -(-a.nbytes // 64) * 64
+    head = json.dumps(header).encode('utf-8')
+    start = -(-(len(magic) + 8 + len(head)) // 64) * 64
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(magic + struct.pack('<II', store_version, len(head)) + head)
+        for key, a in arrays.items():
+            f.seek(start + header['arrays'][key]['offset'])
+            f.write(a.tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+    return path
+
+
+class GlassStore:
+
+    def __init__(self, path=default_store):
+        with open(path, 'rb') as f:
+            head = f.read(len(magic) + 8)
+            if head[:len(magic)] != magic:
+                raise ValueError('{}: not a glass store'.format(path))
+            version, length = struct.unpack('<II', head[len(magic):])
+            if version != store_version:
+                raise ValueError('{}: store version {}, expected {}'
+                                 .format(path, version, store_version))
+            self.header = json.loads(f.read(length))
+        self.path = path
+        self.catalogs = self.header['catalogs']
+        start = -(-(len(magic) + 8 + length) // 64) * 64
+        self._map = np.memmap(path, np.uint8, 'r')
+        for key, spec in self.header['arrays'].items():
+            setattr(self, key, np.ndarray(tuple(spec['shape']), spec['dtype'],
+                                          self._map, start + spec['offset']))
+        self.wlmin, self.wlmax = self.range[:, 0], self.range[:, 1]
+        self.nd, self.vd = self.ndvd[:, 0], self.ndvd[:, 1]
+        self.status = self.codes[:, 1]
+        self._dispersion = None
+
+    def __len__(self):
+        return len(self.formula)
+
+    def stale(self):
+        # True if the catalog files changed since the store was compiled
+        try:
+            files = [f[0] for f in self.header['files']]
+            return _catalog_key(files) != self.header['files']
+        except OSError:
+            return True
+
+    def _string(self, field, row):
+        offsets = getattr(self, field + '_offsets')
+        blob = getattr(self, field + '_blob')
+        return blob[offsets[row]:offsets[row+1]].tobytes().decode('utf-8')
+
+    def name(self, row):
+        return self._string('name', row)
+
+    def catalog_of(self, row):
+        return self.catalogs[self.catalog[row]]
+
+    def rows(self, name):
+        # rows of all glasses with this name, in catalog order
+        key = np.array(name.encode('utf-8'), self.name_sorted.dtype)
+        lo = np.searchsorted(self.name_sorted, key, 'left')
+        hi = np.searchsorted(self.name_sorted, key, 'right')
+        if hi > lo and self.name_sorted[lo] != name.encode('utf-8'):
+            return []  # longer than any stored name, truncated by the dtype
+        return sorted(self.name_order[lo:hi].tolist())
+
+    def find(self, name, catalog=None):
+        # row of a glass, from the last catalog (in file order) listing it
+        rows = [i for i in self.rows(name)
+                if catalog is None or self.catalog_of(i).startswith(catalog)]
+        if not rows:
+            raise KeyError(name)
+        return rows[-1]
+
+    def glass(self, row):
+        # the full Glass record, as read_agf() would have yielded it
+        it = self.it[self.it_offsets[row]:self.it_offsets[row+1]]
+        return Glass(self.name(row), int(self.formula[row]),
+                     self._string('glasscode', row),
+                     *self.ndvd[row].tolist(), *self.codes[row].tolist(),
+                     self._string('comments', row), *self.range[row].tolist(),
+                     np.array(self.coefficients[row, :self.ncoefficients[row]]),
+                     np.array(self.thermal[row]),
+                     *self.ed[row].tolist(), *self.od[row].tolist(),
+                     np.array(it[:, 0]), np.array(it[:, 1]), np.array(it[:, 2]),
+                     self._string('nd_text', row), self._string('vd_text', row))
+
+    def dispersion(self):
+        if self._dispersion is None:
+            self._dispersion = DispersionTable(self.formula, self.coefficients,
+                                               self.wlmin, self.wlmax)
+        return self._dispersion
+
+
+def open_store(path=default_store, files=None):
+    # the store at path, compiled first if missing or out of date
+    if os.path.exists(path):
+        try:
+            store = GlassStore(path)
+            if not store.stale():
+                return store
+        except ValueError:
+            pass
+    compile_store(files, path)
+    return GlassStore(path)
+
+
+if __name__ == "__main__":
+    import sys, time
+    if sys.argv[1:] == ['compile']:
+        t = time.perf_counter()
+        path = compile_store()
+        print('{}: {} glasses, {:.0f} kB, compiled in {:.2f} s'
+              .format(path, len(GlassStore(path)), os.path.getsize(path)/1024,
+                      time.perf_counter() - t))
+        sys.exit(0)
+    if len(sys.argv) < 2:
+        print("Usage: python {} compile | <glass name> ...".format(__file__))
+        sys.exit(1)
+    t = time.perf_counter()
+    store = open_store()
+    t_open = time.perf_counter() - t
+    wl = np.array([0.4861327, 0.5875618, 0.6562725])
+    for name in sys.argv[1:]:
+        for row in store.rows(name):
+            nF, nd, nC = store.dispersion().n(wl)[row]
+            print('{:20s} {:12s} formula {:2d}  nd={:.6f}  Vd={:.3f}'
+                  .format(store.catalog_of(row), name, store.formula[row],
+                          nd, (nd - 1)/(nF - nC)))
+    print('store opened in {:.2f} ms'.format(t_open*1e3))
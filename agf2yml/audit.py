@@ -0,0 +1,107 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             audit (stated nd, Vd and dPgF against the CD coefficients)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy
+#------------------------------------------------------------------------------
+
+#  usage: python audit.py                       (all catalogs in input/)
+#         python audit.py input/ohara_2017-11-30.agf --nd 1e-5 -v
+#
+#  nd, ne, Vd, Ve and the partial dispersions of the Schott data sheets are
+#  recomputed from the dispersion formulas at the Fraunhofer lines (one
+#  DispersionTable evaluation of all glasses at all lines, outside the LD
+#  range too) and compared with nd and Vd of the NM record and with dPgF of
+#  the ED record. dPgF is the deviation from the normal line
+#  PgF = 0.6438 - 0.001682 Vd; vendors using another normal line differ by
+#  up to a few 1e-3, hence the wide default tolerance.
+
+import numpy as np
+
+from agf import read_catalogs
+from dispersion import DispersionTable
+
+# Fraunhofer lines [μm]
+lines = {'i': 0.36501, 'h': 0.404656, 'g': 0.4358343, "F'": 0.4799914,
+         'F': 0.4861327, 'e': 0.546074, 'd': 0.5875618, 'D': 0.5892938,
+         "C'": 0.6438469, 'C': 0.6562725, 'r': 0.7065188, 's': 0.85211,
+         't': 1.01398}
+
+# partial dispersions P_x,y = (nx - ny)/(nF - nC), primed: /(nF' - nC')
+partials = [('s', 't'), ('C', 's'), ('d', 'C'), ('e', 'd'), ('g', 'F'),
+            ('F', 'e'), ('i', 'g')]
+partials_primed = [("C'", 's'), ('d', "C'"), ('e', 'd'), ('g', "F'"),
+                   ("F'", 'e'), ('i', 'g')]
+
+tolerance = {'nd': 5e-5, 'Vd': 0.05, 'dPgF': 5e-3}
+
+
+def audit(glasses):
+    # recomputed values of every glass: dict of arrays, keys 'n<line>',
+    # 'nd', 'ne', 'Vd', 'Ve', 'P<x>,<y>', "P'<x>,<y>", 'dPgF' and the
+    # differences 'Δnd', 'ΔVd', 'ΔdPgF' (recomputed - stated)
+    glasses = list(glasses)
+    n = DispersionTable.from_glasses(glasses).n(list(lines.values()), mask=False)
+    n = dict(zip(lines, n.T))
+    r = {'n' + line: n[line] for line in lines}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dFC, dFC_ = n['F'] - n['C'], n["F'"] - n["C'"]
+        r['Vd'], r['Ve'] = (n['d'] - 1)/dFC, (n['e'] - 1)/dFC_
+        for x, y in partials:
+            r['P{},{}'.format(x, y)] = (n[x] - n[y])/dFC
+        for x, y in partials_primed:
+            r["P'{},{}".format(x, y)] = (n[x] - n[y])/dFC_
+        r['dPgF'] = r['Pg,F'] - (0.6438 - 0.001682*r['Vd'])
+    dpgf = np.array([gd.dpgf for gd in glasses], float)
+    dpgf[dpgf == 0] = np.nan # 0 stands for not given
+    r['Δnd'] = r['nd'] - np.array([gd.nd for gd in glasses], float)
+    r['ΔVd'] = r['Vd'] - np.array([gd.vd for gd in glasses], float)
+    r['ΔdPgF'] = r['dPgF'] - dpgf
+    return r
+
+
+def flags(result, tolerance=tolerance):
+    # failed checks: boolean array (glasses, checks), one column per key of
+    # tolerance; NaN values (unknown formula, missing dPgF) do not fail
+    with np.errstate(invalid='ignore'):
+        return np.column_stack([np.abs(result['Δ' + key]) > tol
+                                for key, tol in tolerance.items()])
+
+
+if __name__ == "__main__":
+    import argparse, time
+    parser = argparse.ArgumentParser(description="""
+                                     Checks that the CD coefficients reproduce
+                                     the stated nd, Vd and dPgF.
+                                     """)
+    parser.add_argument('files', nargs='*', help='.agf files (default: input/*)')
+    for key, tol in tolerance.items():
+        parser.add_argument('--' + key, type=float, default=tol,
+                            help='tolerance of {} (default: {})'.format(key, tol))
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print recomputed values of every flagged glass')
+    args = parser.parse_args()
+
+    catalogs, glasses = zip(*read_catalogs(args.files or None))
+    t = time.perf_counter()
+    result = audit(glasses)
+    failed = flags(result, {key: getattr(args, key) for key in tolerance})
+    t = time.perf_counter() - t
+    for i in np.flatnonzero(failed.any(axis=1)):
+        gd = glasses[i]
+        checks = ','.join(key for key, f in zip(tolerance, failed[i]) if f)
+        print('{:20s} {:16s} {:12s} Δnd={:+.2e} ΔVd={:+.3f} ΔdPgF={:+.4f}'
+              .format(catalogs[i], gd.name, checks, result['Δnd'][i],
+                      result['ΔVd'][i], result['ΔdPgF'][i]))
+        if args.verbose:
+            print('    formula {}  nd={:.6f} ne={:.6f} Vd={:.3f} Ve={:.3f}  '
+                  .format(gd.formula, result['nd'][i], result['ne'][i],
+                          result['Vd'][i], result['Ve'][i]) +
+                  ' '.join('P{},{}={:.4f}'.format(x, y, result['P{},{}'.format(x, y)][i])
+                           for x, y in partials))
+    print('{} glasses, {} flagged, audited in {:.1f} ms'
+          .format(len(glasses), np.sum(failed.any(axis=1)), t*1e3))
@@ -0,0 +1,50 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             agf2yml benchmark: parse, render and write full catalogs
+
+#  usage: python benchmark.py [catalog name ...]   (default: ohara cdgm)
+#
+#  Files are written to a temporary directory, which is removed afterwards.
+#  Every stage is repeated and the best time is reported.
+
+import sys, time, tempfile, shutil
+
+from agf import read_agf
+from agf2yml import agf_catalogs, RenderYML, WriteYML
+
+repeat = 5
+
+
+def best(f):
+    times = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def bench(name):
+    catalog = agf_catalogs[name]
+    glasses = list(read_agf(catalog['file']))
+    out_dir = tempfile.mkdtemp(prefix='agf2yml-')
+    try:
+        t_parse = best(lambda: list(read_agf(catalog['file'])))
+        t_render = best(lambda: [RenderYML(gd, catalog['refs']) for gd in glasses])
+        t_write = best(lambda: [WriteYML(gd, out_dir, catalog['refs'], None)
+                                for gd in glasses])
+    finally:
+        shutil.rmtree(out_dir)
+    n = len(glasses)
+    print('{:8s} {:4d} glasses   parse {:7.1f} ms   render {:7.1f} ms   '
+          'render+write {:7.1f} ms   ({:.0f} glasses/s)'
+          .format(name, n, t_parse*1e3, t_render*1e3, t_write*1e3,
+                  n/(t_parse + t_write)))
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or ['ohara', 'cdgm']:
+        bench(name)
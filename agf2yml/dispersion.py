@@ -0,0 +1,157 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             dispersion (refractive index from Zemax CD coefficients)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy
+#------------------------------------------------------------------------------
+
+#  table = DispersionTable.from_glasses(read_agf('input/ohara_2017-11-30.agf'))
+#  n = table.n(np.linspace(0.4, 0.7, 301))   # shape (glasses, wavelengths)
+#
+#  Glasses are grouped by formula code; each group keeps its coefficients as
+#  one stacked matrix and is evaluated with a single broadcast expression (a
+#  matrix product for the polynomial formulas). Wavelengths are in μm and
+#  relative to air, as in the catalogs. Outside the LD range of a glass the
+#  result is NaN unless mask=False.
+
+import numpy as np
+
+from agf import read_catalogs
+
+formula_name = {1: 'Schott', 2: 'Sellmeier 1', 3: 'Herzberger',
+                4: 'Sellmeier 2', 5: 'Conrady', 6: 'Sellmeier 3',
+                7: 'Handbook of Optics 1', 8: 'Handbook of Optics 2',
+                9: 'Sellmeier 4', 10: 'Extended', 11: 'Sellmeier 5',
+                12: 'Extended 2', 13: 'Extended 3'}
+
+# n² = sum_i c_i λ^p_i
+polynomial_powers = {1: [0, 2, -2, -4, -6, -8],
+                     10: [0, 2, -2, -4, -6, -8, -10, -12],
+                     12: [0, 2, -2, -4, -6, -8, 4, 6],
+                     13: [0, 2, 4, -2, -4, -6, -8, -10, -12]}
+
+# n² - 1 = sum_i K_i λ²/(λ² - L_i), coefficients K1 L1 K2 L2 ...
+sellmeier_terms = {2: 3, 6: 4, 11: 5}
+
+ncoefficients = 10
+
+
+def _polynomial(C, wl, powers):
+    if wl.ndim == 1:
+        P = wl[np.newaxis, :] ** np.array(powers, float)[:, np.newaxis]
+        n2 = C[:, :len(powers)] @ P
+    else:
+        n2 = np.zeros(wl.shape)
+        for i, p in enumerate(powers):
+            n2 += C[:, i, np.newaxis] * wl**p
+    return np.sqrt(n2, out=n2)
+
+
+def _sellmeier(C, w2, terms):
+    # K λ²/(λ² - L) = K + K L/(λ² - L), accumulated in place
+    K, L = C[:, 0:2*terms:2], C[:, 1:2*terms:2]
+    shape = np.broadcast_shapes(w2.shape, (len(C), 1))
+    n2 = np.empty(shape)
+    n2[...] = 1 + K.sum(axis=1, keepdims=True)
+    tmp = np.empty(shape)
+    for i in range(terms):
+        np.subtract(w2, L[:, i, np.newaxis], out=tmp)
+        np.divide((K[:, i]*L[:, i])[:, np.newaxis], tmp, out=tmp)
+        n2 += tmp
+    return np.sqrt(n2, out=n2)
+
+
+def _evaluate(code, C, wl):
+    # refractive index of a group of glasses sharing formula `code`
+    if code in polynomial_powers:
+        return _polynomial(C, wl, polynomial_powers[code])
+    w2 = wl**2 if wl.ndim == 2 else (wl**2)[np.newaxis, :]
+    if code in sellmeier_terms:
+        return _sellmeier(C, w2, sellmeier_terms[code])
+    c = [C[:, i, np.newaxis] for i in range(ncoefficients)]
+    if code == 3:
+        L = 1/(w2 - 0.028)
+        return c[0] + c[1]*L + c[2]*L**2 + c[3]*w2 + c[4]*w2**2 + c[5]*w2**3
+    if code == 4:
+        return np.sqrt(1 + c[0] + c[1]*w2/(w2 - c[2]**2) + c[3]/(w2 - c[4]**2))
+    if code == 5:
+        wl = np.sqrt(w2)
+        return c[0] + c[1]/wl + c[2]/wl**3.5
+    if code == 7:
+        return np.sqrt(c[0] + c[1]/(w2 - c[2]) - c[3]*w2)
+    if code == 8:
+        return np.sqrt(c[0] + c[1]*w2/(w2 - c[2]) - c[3]*w2)
+    if code == 9:
+        return np.sqrt(c[0] + c[1]*w2/(w2 - c[2]) + c[3]*w2/(w2 - c[4]))
+    raise ValueError('unknown dispersion formula {}'.format(code))
+
+
+class DispersionTable:
+    # stacked CD coefficients of many glasses, grouped by formula
+
+    def __init__(self, formula, coefficients, wlmin, wlmax, names=None):
+        self.formula = np.asarray(formula, int)
+        self.coefficients = np.asarray(coefficients, float)
+        self.wlmin = np.asarray(wlmin, float)
+        self.wlmax = np.asarray(wlmax, float)
+        self.names = names
+        self.groups = {}
+        for code in np.unique(self.formula):
+            rows = np.flatnonzero(self.formula == code)
+            self.groups[int(code)] = (rows, self.coefficients[rows],
+                                      self.wlmin[rows, np.newaxis],
+                                      self.wlmax[rows, np.newaxis])
+
+    @classmethod
+    def from_glasses(cls, glasses):
+        glasses = list(glasses)
+        C = np.zeros((len(glasses), ncoefficients))
+        for i, gd in enumerate(glasses):
+            C[i, :len(gd.coefficients)] = gd.coefficients[:ncoefficients]
+        return cls([gd.formula for gd in glasses], C,
+                   [gd.wlmin for gd in glasses], [gd.wlmax for gd in glasses],
+                   [gd.name for gd in glasses])
+
+    def __len__(self):
+        return len(self.formula)
+
+    def subset(self, rows):
+        # table of some of the glasses (a slice or an index array)
+        names = None if self.names is None else list(np.asarray(self.names)[rows])
+        return DispersionTable(self.formula[rows], self.coefficients[rows],
+                               self.wlmin[rows], self.wlmax[rows], names)
+
+    def n(self, wl, mask=True):
+        # wl: 1-D array shared by all glasses, or one row per glass (2-D)
+        wl = np.asarray(wl, float)
+        shared = wl.ndim == 1
+        out = np.full((len(self), wl.shape[-1]), np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for code, (group, C, lo, hi) in self.groups.items():
+                if code not in formula_name:
+                    continue # unknown formula: NaN
+                w = wl if shared else wl[group]
+                n = _evaluate(code, C, w)
+                if mask:
+                    n[(w < lo) | (w > hi)] = np.nan
+                out[group] = n
+        return out
+
+
+if __name__ == "__main__":
+    # timing over every glass of every catalog in input/
+    import time
+    catalogs, glasses = zip(*read_catalogs())
+    table = DispersionTable.from_glasses(glasses)
+    wl = np.linspace(0.3, 2.5, 10000)
+    t = time.perf_counter()
+    n = table.n(wl)
+    t = time.perf_counter() - t
+    print('{} glasses x {} wavelengths: {:.3f} s'.format(len(table), len(wl), t))
+    for code, (rows, *_) in sorted(table.groups.items()):
+        print('  formula {:2d} ({}): {} glasses'
+              .format(code, formula_name.get(code, '?'), len(rows)))
@@ -0,0 +1,199 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             glassmap (nearest substitute glasses across catalogs)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy, SciPy
+#------------------------------------------------------------------------------
+
+#  usage: python glassmap.py N-BK7 --from ohara hoya cdgm sumita -k 5
+#
+#  Glasses of all catalogs in input/ are placed on the (nd, Vd) glass map,
+#  optionally with dPgF as a third axis. A glass listed by several versions
+#  of a vendor's catalog is placed once, with its record from the last
+#  (newest) file, so it is not its own nearest neighbour; glasses of other
+#  vendors that share its name are kept. Glasses without dPgF are left out of
+#  the 3-D map. Distances are measured in units of
+#  `scale` (by default Δnd = 0.01, ΔVd = 1 and ΔdPgF = 0.005 count as 1).
+#  All points share one KD-tree; catalog and status filters become a row mask
+#  (computed once per filter) and the tree is asked for more neighbours until
+#  k of them pass it, so filtered queries stay exact. The map is pickled to a
+#  cache file, keyed by size and mtime of the catalogs.
+
+import os, pickle
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from agf import read_catalogs, catalog_files, status_name, vendor
+
+cache_version = 3 # bump whenever GlassMap attributes change
+default_cache = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '.glassmap.pickle')
+
+
+class GlassMap:
+
+    def __init__(self, entries, scale=(0.01, 1.0, 0.005), dpgf=False, unique=True):
+        # entries: (catalog, Glass) pairs; with unique, a glass listed by
+        # several catalogs of one vendor is kept once, with its last record
+        entries = list(entries)
+        if unique:
+            last = {(vendor(c), gd.name): i for i, (c, gd) in enumerate(entries)}
+            entries = [entries[i] for i in sorted(last.values())]
+        self.scale = np.array(scale[:3 if dpgf else 2], float)
+        self.dpgf = dpgf
+        self.catalog, self.name, self.status, points = [], [], [], []
+        for catalog, gd in entries:
+            self.catalog.append(catalog)
+            self.name.append(gd.name)
+            self.status.append(gd.status)
+            points.append((gd.nd, gd.vd, gd.dpgf))
+        self.points = np.array(points, float).reshape(-1, 3)[:, :len(self.scale)]
+        self.rows = {}
+        for i, name in enumerate(self.name):
+            self.rows.setdefault(name, []).append(i)
+        self.catalogs, self.catalog_id = np.unique(self.catalog,
+                                                   return_inverse=True)
+        # glasses lacking a coordinate (dPgF) are not on the map
+        self.mapped = np.isfinite(self.points).all(axis=1)
+        self.tree_rows = np.flatnonzero(self.mapped)
+        self.tree = cKDTree(self.points[self.tree_rows] / self.scale)
+        self.masks = {}
+
+    def mask(self, catalogs=None, status=None):
+        # rows passing the filters and their number: catalogs match by prefix ('ohara' selects
+        # every Ohara file), status by number or by name ('preferred')
+        key = (None if catalogs is None else tuple(catalogs),
+               None if status is None else tuple(status))
+        if key not in self.masks:
+            mask = self.mapped.copy()
+            if catalogs is not None:
+                ids = [i for i, c in enumerate(self.catalogs)
+                       if any(c.startswith(p) for p in catalogs)]
+                mask &= np.isin(self.catalog_id, ids)
+            if status is not None:
+                codes = {v: k for k, v in status_name.items()}
+                mask &= np.isin(self.status, [codes.get(s, s) for s in status])
+            self.masks[key] = mask, int(mask.sum())
+        return self.masks[key]
+
+    def find(self, name, catalog=None):
+        # row of a glass, from the last catalog (in file order) listing it
+        rows = [i for i in self.rows.get(name, [])
+                if catalog is None or self.catalog[i].startswith(catalog)]
+        if not rows:
+            raise KeyError(name)
+        return rows[-1]
+
+    def query(self, x, k=5, catalogs=None, status=None, exclude=()):
+        # k nearest glasses to point x: list of (distance, row)
+        x = np.asarray(x, float)[:len(self.scale)] / self.scale
+        if not np.isfinite(x).all():
+            raise ValueError('point not on the map (no dPgF?)')
+        mask, passing = self.mask(catalogs, status)
+        n = len(self.tree_rows)
+        k = min(k, passing)
+        if k == 0:
+            return []
+        # expected number of neighbours needed for k of them to pass
+        kk = min(int((k + len(exclude)) * n / passing) + 1, n)
+        while True:
+            d, j = self.tree.query(x, kk)
+            d, j = np.atleast_1d(d), self.tree_rows[np.atleast_1d(j)]
+            keep = mask[j]
+            for i in exclude:
+                keep &= j != i
+            if keep.sum() >= k or kk == n:
+                return list(zip(d[keep][:k].tolist(), j[keep][:k].tolist()))
+            kk = min(2*kk, n)
+
+    def within(self, x, r, catalogs=None, status=None, exclude=()):
+        # all glasses within distance r of x, nearest first
+        x = np.asarray(x, float)[:len(self.scale)] / self.scale
+        if not np.isfinite(x).all():
+            raise ValueError('point not on the map (no dPgF?)')
+        mask = self.mask(catalogs, status)[0]
+        rows = [i for i in self.tree_rows[self.tree.query_ball_point(x, r)].tolist()
+                if mask[i] and i not in exclude]
+        d = np.linalg.norm(self.points[rows]/self.scale - x, axis=1)
+        return sorted(zip(d.tolist(), rows))
+
+    def substitutes(self, name, k=5, catalog=None, **filters):
+        # nearest glasses to a named glass, the glass itself excluded
+        row = self.find(name, catalog)
+        return self.query(self.points[row], k, exclude={row}, **filters)
+
+
+def _key(files, scale, dpgf):
+    return (cache_version, tuple(scale), dpgf,
+            tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns)
+                  for path in files))
+
+
+def load(cache=default_cache, files=None, scale=(0.01, 1.0, 0.005), dpgf=False):
+    # the cached map if the catalogs did not change, otherwise a new one
+    files = files or catalog_files()
+    key = _key(files, scale, dpgf)
+    try:
+        with open(cache, 'rb') as f:
+            cached_key, glassmap = pickle.load(f)
+        if cached_key == key:
+            return glassmap
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError,
+            AttributeError, ImportError):
+        pass
+    glassmap = GlassMap(read_catalogs(files), scale, dpgf)
+    tmp = '{}.{}.tmp'.format(cache, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump((key, glassmap), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache)
+    return glassmap
+
+
+if __name__ == "__main__":
+    import argparse, time
+    parser = argparse.ArgumentParser(description="""
+                                     Finds the glasses closest to a given
+                                     glass on the (nd, Vd[, dPgF]) map.
+                                     """)
+    parser.add_argument('glass', help='glass name, e.g. N-BK7')
+    parser.add_argument('-c', '--catalog', default=None,
+                        help='catalog of the glass (default: last one listing it)')
+    parser.add_argument('--from', dest='catalogs', nargs='+', default=None,
+                        help='search only these catalogs (file name prefixes)')
+    parser.add_argument('-s', '--status', nargs='+', default=None,
+                        choices=list(status_name.values()),
+                        help='accepted glass status')
+    parser.add_argument('-k', type=int, default=5, help='number of glasses')
+    parser.add_argument('-r', '--radius', type=float, default=None,
+                        help='list all glasses within this distance instead')
+    parser.add_argument('--dpgf', action='store_true',
+                        help='use dPgF as a third coordinate')
+    args = parser.parse_args()
+
+    from glassmap import load  # so that the pickled class is glassmap.GlassMap
+    glassmap = load(dpgf=args.dpgf)
+    row = glassmap.find(args.glass, args.catalog)
+    x = glassmap.points[row]
+    if not glassmap.mapped[row]:
+        parser.error('{} has no dPgF'.format(args.glass))
+    if args.dpgf and not glassmap.mapped.all():
+        print('{} glasses without dPgF left out'.format(np.sum(~glassmap.mapped)))
+    t = time.perf_counter()
+    if args.radius is None:
+        found = glassmap.query(x, args.k, args.catalogs, args.status, {row})
+    else:
+        found = glassmap.within(x, args.radius, args.catalogs, args.status, {row})
+    t = time.perf_counter() - t
+    print('{} ({}): nd={:.5f} Vd={:.2f}'.format(args.glass, glassmap.catalog[row],
+                                               *x[:2]))
+    for d, i in found:
+        print('  {:8.3f}  {:20s} {:12s} nd={:.5f} Vd={:.2f} {}'
+              .format(d, glassmap.catalog[i], glassmap.name[i],
+                      *glassmap.points[i][:2],
+                      status_name.get(glassmap.status[i], '')))
+    print('query time: {:.1f} μs'.format(t*1e6))
@@ -0,0 +1,164 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             pairs (achromatic and athermal glass pairs)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy
+#------------------------------------------------------------------------------
+
+#  usage: python pairs.py -k 20                     (achromats, all catalogs)
+#         python pairs.py --housing 23.6 --from ohara -s preferred
+#
+#  Thin doublet in contact, total power 1: the powers are Va/(Va - Vb) and
+#  -Vb/(Va - Vb), the secondary spectrum is ΔPgF/ΔVd and the thermal focal
+#  drift of the doublet is -(γa Va - γb Vb)/(Va - Vb), where
+#  γ = (dn/dT)/(nd - 1) - CTE is the thermo-optic coefficient of a glass.
+#  Vd, PgF and dn/dT (at the d line and temperature T) are computed from the
+#  CD and TD data, CTE is the -30/+70°C value of the ED record.
+#
+#  Achromats are ranked by |ΔPgF/ΔVd|; with a housing CTE (1e-6/K) the cost
+#  is |ΔPgF/ΔVd| + weight·|drift - housing CTE| [1/K], so by default 1e-6/K
+#  of focal mismatch counts as much as 1e-4 of secondary spectrum.
+#  Glasses are sorted by Vd, so the partners with Va - Vb >= min ΔV of a block
+#  of glasses form a prefix of the table; pairs are scored a block at a time
+#  and only the running top k are kept.
+
+import numpy as np
+
+from agf import read_catalogs, status_name, vendor
+from thermal import ThermalTable
+
+# Fraunhofer lines [μm]
+wl_g, wl_F, wl_d, wl_C = 0.4358343, 0.4861327, 0.5875618, 0.6562725
+
+
+class PairSearch:
+
+    def __init__(self, entries, T=20.0, unique=True):
+        # entries: (catalog, Glass) pairs; with unique, a glass listed by
+        # several catalogs (versions) of one vendor is kept from the last one
+        entries = list(entries)
+        if unique:
+            last = {(vendor(c), gd.name): i for i, (c, gd) in enumerate(entries)}
+            entries = [entries[i] for i in sorted(last.values())]
+        glasses = [gd for c, gd in entries]
+        thermal = ThermalTable.from_glasses(glasses)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            nF, nd, nC, ng = thermal.dispersion.n([wl_F, wl_d, wl_C, wl_g]).T
+            vd = (nd - 1)/(nF - nC)
+            pgf = (ng - nF)/(nF - nC)
+            dndT = thermal.n([wl_d], [T])[1][:, 0, 0]
+            gamma = dndT/(nd - 1) - np.array([gd.cte1 for gd in glasses])*1e-6
+        # sort by Vd; glasses without a valid Vd are dropped
+        order = np.flatnonzero(np.isfinite(vd) & np.isfinite(pgf))
+        order = order[np.argsort(vd[order], kind='stable')]
+        self.catalog = [entries[i][0] for i in order]
+        self.name = [glasses[i].name for i in order]
+        self.status = np.array([glasses[i].status for i in order], int)
+        self.nd, self.vd, self.pgf, self.gamma = nd[order], vd[order], pgf[order], gamma[order]
+
+    def __len__(self):
+        return len(self.name)
+
+    def mask(self, catalogs=None, status=None):
+        # catalogs match by prefix, status by number or by name
+        mask = np.ones(len(self), bool)
+        if catalogs is not None:
+            mask &= [any(c.startswith(p) for p in catalogs) for c in self.catalog]
+        if status is not None:
+            codes = {v: k for k, v in status_name.items()}
+            mask &= np.isin(self.status, [codes.get(s, s) for s in status])
+        return mask
+
+    def search(self, k=10, min_dv=10.0, housing=None, weight=100.0,
+               catalogs=None, status=None, block=256):
+        # best k pairs: list of (cost, a, b) with Va > Vb, best first
+        keep = self.mask(catalogs, status)
+        athermal = housing is not None
+        if athermal:
+            keep &= np.isfinite(self.gamma)
+        rows = np.flatnonzero(keep)
+        vd, pgf, gamma = self.vd[rows], self.pgf[rows], self.gamma[rows]
+        best_cost, best_a, best_b = np.zeros(0), np.zeros(0, int), np.zeros(0, int)
+        bound = np.inf # cost of the k-th best pair so far
+        # partners of row i: the first searchsorted(vd, vd[i] - min_dv) rows
+        ends = np.searchsorted(vd, vd - min_dv, 'right')
+        for start in range(0, len(rows), block):
+            a = np.arange(start, min(start + block, len(rows)))
+            m = ends[a[-1]]
+            if m == 0:
+                continue
+            dv = vd[a, np.newaxis] - vd[np.newaxis, :m]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                cost = np.abs(pgf[a, np.newaxis] - pgf[np.newaxis, :m])/dv
+                if athermal:
+                    drift = -(gamma[a, np.newaxis]*vd[a, np.newaxis]
+                              - gamma[np.newaxis, :m]*vd[np.newaxis, :m])/dv
+                    cost += weight*np.abs(drift - housing*1e-6)
+            cost[np.arange(m)[np.newaxis, :] >= ends[a, np.newaxis]] = np.inf
+            cost[~np.isfinite(cost)] = np.inf
+            flat = np.flatnonzero(cost < bound)
+            if len(flat) > k:
+                flat = flat[np.argpartition(cost.flat[flat], k)[:k]]
+            best_cost = np.concatenate([best_cost, cost.flat[flat]])
+            best_a = np.concatenate([best_a, a[flat // m]])
+            best_b = np.concatenate([best_b, flat % m])
+            if len(best_cost) > k:
+                top = np.argpartition(best_cost, k)[:k]
+                best_cost, best_a, best_b = best_cost[top], best_a[top], best_b[top]
+            if len(best_cost) == k:
+                bound = best_cost.max()
+        order = np.argsort(best_cost, kind='stable')
+        return [(c, rows[a], rows[b]) for c, a, b in
+                zip(best_cost[order].tolist(), best_a[order], best_b[order])]
+
+    def describe(self, a, b):
+        # powers, secondary spectrum and focal drift [1/K] of a pair
+        dv = self.vd[a] - self.vd[b]
+        drift = -(self.gamma[a]*self.vd[a] - self.gamma[b]*self.vd[b])/dv
+        return (self.vd[a]/dv, -self.vd[b]/dv,
+                (self.pgf[a] - self.pgf[b])/dv, drift)
+
+
+if __name__ == "__main__":
+    import argparse, time
+    parser = argparse.ArgumentParser(description="""
+                                     Ranks glass pairs for an achromatic
+                                     (and optionally athermal) doublet.
+                                     """)
+    parser.add_argument('-k', type=int, default=10, help='number of pairs')
+    parser.add_argument('--min-dv', type=float, default=10.0,
+                        help='minimum Vd difference (default: 10)')
+    parser.add_argument('--housing', type=float, default=None,
+                        help='CTE of the housing [1e-6/K]: athermal search')
+    parser.add_argument('--weight', type=float, default=100.0,
+                        help='weight of the focal drift mismatch [K]')
+    parser.add_argument('-T', type=float, default=20.0,
+                        help='temperature of dn/dT [°C] (default: 20)')
+    parser.add_argument('--from', dest='catalogs', nargs='+', default=None,
+                        help='use only these catalogs (file name prefixes)')
+    parser.add_argument('-s', '--status', nargs='+', default=None,
+                        choices=list(status_name.values()),
+                        help='accepted glass status')
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    pairs = PairSearch(read_catalogs(), args.T)
+    t_load = time.perf_counter() - t
+    t = time.perf_counter()
+    found = pairs.search(args.k, args.min_dv, args.housing, args.weight,
+                         args.catalogs, args.status)
+    t_search = time.perf_counter() - t
+    print('{:>10s}  {:30s} {:30s} {:>7s} {:>7s} {:>9s} {:>9s}'
+          .format('cost', 'glass a', 'glass b', 'φa', 'φb', 'ΔP/ΔV', 'drift'))
+    for cost, a, b in found:
+        phi_a, phi_b, ssp, drift = pairs.describe(a, b)
+        print('{:10.3e}  {:30s} {:30s} {:7.3f} {:7.3f} {:9.2e} {:9.2e}'
+              .format(cost, pairs.catalog[a] + ' ' + pairs.name[a],
+                      pairs.catalog[b] + ' ' + pairs.name[b],
+                      phi_a, phi_b, ssp, drift))
+    print('{} glasses: table {:.2f} s, search {:.3f} s'
+          .format(len(pairs), t_load, t_search))
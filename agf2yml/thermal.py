@@ -0,0 +1,101 @@
+###############################################################################
+#         THIS PROGRAM IS IN PUBLIC DOMAIN                                    #
+#         COPYRIGHT AND RELATED RIGHTS WAIVED VIA CC0 1.0                     #
+###############################################################################
+
+#             thermal (refractive index vs. temperature from TD data)
+
+#------------------------------------------------------------------------------
+#  dependencies: Python3, NumPy
+#------------------------------------------------------------------------------
+
+#  usage: python thermal.py [glass name ...]      (dn/dT at 20, 40 and 60°C)
+#
+#  table = ThermalTable.from_glasses(read_agf('input/ohara_2017-11-30.agf'))
+#  n, dndT = table.n(wl, T)                # shape (glasses, temperatures, wavelengths)
+#  for rows, n, dndT in table.chunks(wl, T):
+#      ...                                 # the same, a block of glasses at a time
+#
+#  Schott formula, as used by Zemax for the TD record (ΔT = T - Tref in °C):
+#  Δn = (n² - 1)/(2n) [D0 ΔT + D1 ΔT² + D2 ΔT³ + (E0 ΔT + E1 ΔT²)/(λ² - S λtk²)]
+#  where n is the catalog index at Tref and S the sign of λtk. The change is
+#  added to the catalog index; the index of air is not corrected. The index
+#  at Tref is evaluated once per block and broadcast over the temperatures.
+#  Glasses without TD data give NaN.
+
+import numpy as np
+
+from agf import read_catalogs
+from dispersion import DispersionTable
+
+max_elements = 2**22 # per array of one block: glasses x temperatures x wavelengths
+
+
+class ThermalTable:
+    # dispersion table and stacked TD coefficients of many glasses
+
+    def __init__(self, dispersion, thermal):
+        self.dispersion = dispersion
+        self.thermal = np.asarray(thermal, float).reshape(-1, 7)
+
+    @classmethod
+    def from_glasses(cls, glasses):
+        glasses = list(glasses)
+        return cls(DispersionTable.from_glasses(glasses),
+                   [gd.thermal for gd in glasses])
+
+    def __len__(self):
+        return len(self.thermal)
+
+    def _block(self, rows, wl, T):
+        n0 = self.dispersion.subset(rows).n(wl)[:, np.newaxis, :]
+        D0, D1, D2, E0, E1, wltk, Tref = [c[:, np.newaxis, np.newaxis]
+                                          for c in self.thermal[rows].T]
+        dT = T[np.newaxis, :, np.newaxis] - Tref
+        pole = 1/(wl**2 - np.sign(wltk)*wltk**2)
+        a = (n0**2 - 1)/(2*n0)
+        dn = a*(dT*(D0 + dT*(D1 + dT*D2)) + dT*(E0 + dT*E1)*pole)
+        dndT = a*(D0 + dT*(2*D1 + 3*dT*D2) + (E0 + 2*dT*E1)*pole)
+        return n0 + dn, dndT
+
+    def chunks(self, wl, T, max_elements=max_elements):
+        # yields (rows, n, dndT) for consecutive blocks of glasses
+        wl, T = np.atleast_1d(np.asarray(wl, float)), np.atleast_1d(np.asarray(T, float))
+        block = max(max_elements // (len(T)*len(wl)), 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for start in range(0, len(self), block):
+                rows = slice(start, min(start + block, len(self)))
+                yield (rows, *self._block(rows, wl, T))
+
+    def n(self, wl, T, max_elements=max_elements):
+        # index and dn/dT [1/K] of every glass: arrays (glasses, len(T), len(wl))
+        wl, T = np.atleast_1d(np.asarray(wl, float)), np.atleast_1d(np.asarray(T, float))
+        n = np.empty((len(self), len(T), len(wl)))
+        dndT = np.empty_like(n)
+        for rows, n[rows], dndT[rows] in self.chunks(wl, T, max_elements):
+            pass
+        return n, dndT
+
+
+if __name__ == "__main__":
+    import sys, time
+    catalogs, glasses = zip(*read_catalogs())
+    table = ThermalTable.from_glasses(glasses)
+    names = sys.argv[1:]
+    wl = np.array([0.5875618])
+    T = np.array([20., 40., 60.])
+    rows = [i for i, gd in enumerate(glasses) if gd.name in names]
+    selected = ThermalTable(table.dispersion.subset(rows), table.thermal[rows])
+    for i, n, dndT in zip(rows, *selected.n(wl, T)):
+        gd = glasses[i]
+        print('{:20s} {:12s} nd(20°C)={:.6f}  dn/dT [1e-6/K]: {}'
+              .format(catalogs[i], gd.name, n[0, 0],
+                      '  '.join('{:.2f}'.format(x) for x in dndT[:, 0]*1e6)))
+    # timing over every glass of every catalog in input/
+    wl = np.linspace(0.4, 1.0, 601)
+    T = np.linspace(-40, 80, 25)
+    t = time.perf_counter()
+    n, dndT = table.n(wl, T)
+    t = time.perf_counter() - t
+    print('{} glasses x {} temperatures x {} wavelengths: {:.3f} s'
+          .format(len(table), len(T), len(wl), t))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Effective medium approximations: Maxwell-Garnett and Bruggeman mixing rules
+# (see https://en.wikipedia.org/wiki/Effective_medium_approximations)
+#
+# All functions take complex permittivities (e.g. from ldbb.LDBB or from any
+# of the model scripts) and follow NumPy broadcasting, so a whole
+# (fill fraction x wavelength) grid is evaluated in one call:
+#
+#     f = np.linspace(0, 1, 101)[:, np.newaxis]   # fill fractions (column)
+#     eps = bruggeman(eps_au[np.newaxis, :], eps_pmma, f)   # shape (101, nwl)
+#
+# L is the depolarization factor of the inclusions (1/3 for spheres,
+# 0 < L < 1 in general).
+
+import numpy as np
+
+
+def maxwell_garnett(eps_incl, eps_host, f, L=1/3):
+    eps_incl, eps_host, f = np.broadcast_arrays(np.asarray(eps_incl, complex),
+                                                np.asarray(eps_host, complex),
+                                                np.asarray(f, float))
+    Δ = eps_incl - eps_host
+    return eps_host + f*eps_host*Δ / (eps_host + L*(1-f)*Δ)
+
+
+def bruggeman(eps_a, eps_b, f, L=1/3):
+    # symmetric two-phase Bruggeman mixture, f is the fraction of phase a
+    f = np.asarray(f, float)
+    return bruggeman_multi([eps_a, eps_b], [f, 1-f], L)
+
+
+def bruggeman_multi(eps, fractions, L=1/3):
+    # N-phase Bruggeman mixture: sum_i f_i (ε_i-ε)/(ε+L(ε_i-ε)) = 0
+    if len(eps) != len(fractions) or len(eps) < 2:
+        raise ValueError('need matching permittivities and fractions for '
+                         'at least two phases')
+    arrays = np.broadcast_arrays(*[np.asarray(e, complex) for e in eps],
+                                 *[np.asarray(v, float) for v in fractions])
+    N = len(eps)
+    roots = _roots(_polynomial(arrays[:N], [v.real for v in arrays[N:]], L))
+    return _physical_root(roots)
+
+
+def _polynomial(eps, fractions, L):
+    # Multiplying the Bruggeman condition by prod_j ((1-L)ε + L ε_j) gives
+    #     sum_i f_i (ε_i - ε) prod_{j!=i} ((1-L)ε + L ε_j) = 0,
+    # a polynomial of degree N in ε. Returns its coefficients in increasing
+    # powers, each one an array over the whole grid.
+    N = len(eps)
+    poly = [0]*(N+1)
+    for i in range(N):
+        term = [fractions[i]*eps[i], -fractions[i]]
+        for j in range(N):
+            if j != i:
+                term = [L*eps[j]*term[0]] + \
+                       [L*eps[j]*term[k] + (1-L)*term[k-1]
+                        for k in range(1, len(term))] + [(1-L)*term[-1]]
+        poly = [p + t for p, t in zip(poly, term)]
+    return poly
+
+
+def _roots(poly):
+    # roots of the polynomials at every grid point, stacked along axis 0
+    degree = len(poly) - 1
+    if degree == 2:
+        c, b, a = poly
+        sq = np.sqrt(b*b - 4*a*c)
+        # avoid cancellation: q = -(b + sign·sq)/2, roots q/a and c/q
+        sq = np.where((b.conj()*sq).real >= 0, sq, -sq)
+        q = -(b + sq)/2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.stack([q/a, np.where(q != 0, c/q, 0)])
+    # eigenvalues of the companion matrices, all solved in one LAPACK batch
+    shape = poly[0].shape
+    companion = np.zeros(shape + (degree, degree), complex)
+    companion[..., 1:, :-1] = np.eye(degree-1)
+    for k in range(degree):
+        companion[..., k, -1] = -poly[k]/poly[-1]
+    return np.moveaxis(np.linalg.eigvals(companion), -1, 0)
+
+
+def _physical_root(roots, tol=1e-9):
+    # A passive medium has Im(ε) >= 0, and for lossy phases exactly one root
+    # lies in the upper half plane. When all acceptable roots are real
+    # (lossless phases) the one with the largest real part is taken, which
+    # is the branch continuously connected to the pure phases.
+    scale = np.abs(roots).max(axis=0)
+    im = roots.imag / np.where(scale > 0, scale, 1)
+    score = np.where(im > tol, 1 + im,
+                     np.where(im >= -tol, np.arctan(roots.real)/np.pi, -np.inf))
+    return np.take_along_axis(roots, np.argmax(score, axis=0)[np.newaxis],
+                              axis=0)[0]
+
+
+if __name__ == "__main__":
+    # example: Au nanoparticles (Brendel-Bormann model) in PMMA (n=1.49)
+    import os, sys
+    import matplotlib.pyplot as plt
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', 'ldbb'))
+    from ldbb import LDBB
+
+    wl = np.linspace(0.3, 1.0, 701)              # μm
+    eps_au = np.asarray(LDBB('Au', 'BB', wl*1e-6))
+    eps_pmma = 1.49**2
+    f = np.linspace(0, 0.3, 7)[:, np.newaxis]
+
+    eps_mg = maxwell_garnett(eps_au, eps_pmma, f)
+    eps_br = bruggeman(eps_au, eps_pmma, f)
+
+    for i in range(len(f)):
+        plt.plot(wl, eps_mg[i].imag, label='MG f={:.2f}'.format(f[i, 0]))
+        plt.plot(wl, eps_br[i].imag, '--', label='BR f={:.2f}'.format(f[i, 0]))
+    plt.xlabel('Wavelength (μm)')
+    plt.ylabel('Im(ε)')
+    plt.legend()
+    plt.show()
@@ -2,93 +2,250 @@
 # coding: utf-8
 
 import argparse
-import yaml
 
 import os
-import fnmatch
+import sys
+import sqlite3
+
+from dbcache import CheckCache, cache_name
+from dbload import load_files
+from validate import formula_coefficients, wavelength_range, coefficient_count_ok
+from formulas import sweep
+from dbwalk import default_catalogs, scan_data, compare
+from dbindex import DBIndex, index_name
+from duplicates import find_duplicates
+from dbgit import changed_files, change_scope, stat_files, reverse_index
+from dbreport import Report
 
 if __name__ == "__main__":
-    
+
     parser = argparse.ArgumentParser(description="""
                                      Checks that all files on disk also appear
-                                     in the index catalog-nk.yml.
-                                     Also checks that all files in the index
-                                     have their counterpart on disk.
+                                     in the index catalogs (catalog-nk.yml,
+                                     catalog-n2.yml). Also checks that all
+                                     files in the index have their counterpart
+                                     on disk.
                                      """)
-    parser.add_argument('database', action='store', 
+    parser.add_argument('database', action='store',
                                      help='database root directory (database/)')
+    parser.add_argument('-c', '--catalogs', nargs='+', default=default_catalogs,
+                        help='catalog files to check (default: catalog-nk.yml catalog-n2.yml)')
+    parser.add_argument('-l', '--load', action='store_true',
+                        help='also validate the content of every listed data file')
+    parser.add_argument('-f', '--formulas', action='store_true',
+                        help='evaluate every formula on a dense grid over its range')
+    parser.add_argument('-d', '--duplicates', action='store_true',
+                        help='find exact and near-duplicate data files')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='processes for checking data files (default: all cores)')
+    parser.add_argument('-i', '--index', nargs='?', const=True, default=None,
+                        help='update the SQLite metadata index (default file: database/'
+                             + index_name + ')')
+    parser.add_argument('-g', '--git', default=None, metavar='REVISIONS',
+                        help='check only the data files changed in a git revision range '
+                             '(e.g. HEAD~1..HEAD, main); everything if a catalog changed')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='print only the problems, not the catalog tree and summaries')
+    parser.add_argument('--json', default=None, metavar='FILE',
+                        help='write a JSON report (problems, counts, time and memory '
+                             'per stage) to FILE, - for stdout')
+    parser.add_argument('--cache', default=None,
+                        help='cache file (default: database/' + cache_name + ')')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='check everything, do not read or write the cache')
     args = parser.parse_args()
-    
+
     db_path = args.database
+    data_path = os.path.join(db_path, 'data')
+    report = Report(0 if args.json == '-' else 1 if args.quiet else 2)
+    say = report.say
+    cache = CheckCache(None if args.no_cache else
+                       args.cache or os.path.join(db_path, cache_name))
+    index = None
+    if args.index:
+        try:
+            index = DBIndex(os.path.join(db_path, index_name) if args.index is True
+                            else args.index)
+        except (ValueError, sqlite3.DatabaseError) as e:
+            parser.error('-i: {}'.format(e))
+
+    ################################## SCAN ###################################
+
+    with report.stage('scan'):
+        ## With -g, only the data files changed in the revision range are
+        ## looked at, unless a catalog changed.
+        scope = None
+        if args.git:
+            try:
+                scope = change_scope(changed_files(db_path, args.git), args.catalogs)
+            except (OSError, ValueError) as e:
+                parser.error('-g {}: {}'.format(args.git, e))
+            if scope is None:
+                say("Catalogs changed in " + args.git + ", checking the whole database")
+            else:
+                say("{} data files changed in {}".format(len(scope), args.git))
+
+        ## List all YML files in the database, recursively.
+        stats = scan_data(db_path, stat=True) if scope is None else stat_files(db_path, scope)
+        existing_files = set(stats)
 
-    ## List all YML files in the database, recursively.
-    existing_files = [os.path.normpath(os.path.join(dirpath, f))
-                  for dirpath, dirnames, files in os.walk(db_path+"/data")
-                  for f in fnmatch.filter(files, '*.yml')]
-    
     listed_files = []
-    
-    ################################## nk #####################################
-    catalog = "catalog-nk.yml"
-    lib_path = os.path.join(db_path, catalog)
-    library = yaml.safe_load(open(lib_path, 'r', encoding='utf8').read())
-    
-    print("\nFinding data files listed in " + catalog + "\n")
-    
-    for shelf in library:
-        if "SHELF" in shelf:
-            shelf_id = shelf["SHELF"]
-            shelf_name = shelf["name"]
-            print(shelf_id)
-            for book in shelf["content"]:
-                if "BOOK" in book:
-                    book_id = book["BOOK"]
-                    book_name = book["name"]
-                    print("  "+book_id)
-                    for page in book["content"]:
-                        if "PAGE" in page:
-                            page_id = page["PAGE"]
-                            page_name = page["name"]
-                            page_data = page["data"]
-                            page_path = os.path.normpath(os.path.join(db_path, 'data', page_data))
-                            listed_files.append(page_path)
-                            print("    " + page_id + ": " + page_data)
-     
-    ################################## n2 #####################################
-    catalog = "catalog-n2.yml"
-    lib_path = os.path.join(db_path, catalog)
-    library = yaml.safe_load(open(lib_path, 'r', encoding='utf8').read())
-    
-    print("\nFinding data files listed in " + catalog + "\n")
-                            
-    for shelf in library:
-        if "SHELF" in shelf:
-            shelf_id = shelf["SHELF"]
-            shelf_name = shelf["name"]
-            print(shelf_id)
-            for book in shelf["content"]:
-                if "BOOK" in book:
-                    book_id = book["BOOK"]
-                    book_name = book["name"]
-                    print("  "+book_id)
-                    for page in book["content"]:
-                        if "PAGE" in page:
-                            page_id = page["PAGE"]
-                            page_name = page["name"]
-                            page_data = page["data"]
-                            page_path = os.path.normpath(os.path.join(db_path, 'data', page_data))
-                            listed_files.append(page_path)
-                            print("    " + page_id + ": " + page_data)
-                            
+    pages = []
+
+    ################################ CATALOGS #################################
+
+    with report.stage('walk'):
+        for catalog in args.catalogs:
+            if scope is None:
+                say("\nFinding data files listed in " + catalog + "\n")
+
+            shelf_id = book_id = None
+            catalog_files = []
+            for shelf, book, page, data in cache.catalog(db_path, catalog):
+                pages.append((catalog, shelf, book, page, data))
+                catalog_files.append(data)
+                if scope is not None or report.verbosity < 2:
+                    continue
+                if shelf != shelf_id:
+                    shelf_id, book_id = shelf, None
+                    print(shelf)
+                if book != book_id:
+                    book_id = book
+                    print("  " + book)
+                print("    " + page + ": " + data)
+            listed_files += catalog_files
+            report.catalogs[catalog] = {
+                'pages': len(catalog_files), 'data_files': len(set(catalog_files)),
+                'missing': len({path for path in catalog_files if
+                                (scope is None or path in scope) and path not in existing_files})}
+
     ################################ COMPARE ##################################
-        
-    print("{} unique data files listed in the catalogs".format(len(set(listed_files))))
-    
-    diff = set(listed_files).difference(set(existing_files))
-    if(len(diff)==0):
-        print("No missing data files")
-    else:
-        print("Missing data files:")
-        for path in diff:
-            print(path)
 
+    with report.stage('compare'):
+        if scope is not None:
+            ## catalogs unchanged: only the changed files can be missing,
+            ## unlisted or newly listed twice
+            listed_files = [path for path in listed_files if path in scope]
+            referenced = reverse_index(pages)
+            for path in sorted(scope):
+                say(os.path.join(data_path, path))
+                for catalog, shelf, book, page in referenced.get(path, []):
+                    say("    {}: {}/{}/{}".format(catalog, shelf, book, page))
+
+        missing, unlisted, multiple = compare(listed_files, existing_files)
+        report.counts.update({'files_on_disk': len(existing_files),
+                              'references': len(listed_files),
+                              'listed_files': len(set(listed_files)),
+                              'missing': len(missing), 'unlisted': len(unlisted),
+                              'listed_more_than_once': len(multiple)})
+
+        say("\n{} data files on disk, {} references to {} unique data files in the catalogs"
+            .format(len(existing_files), len(listed_files), len(set(listed_files))))
+
+        if not missing:
+            say("No missing data files")
+        else:
+            say("Missing data files:", 1)
+            for path in missing:
+                report.error('missing', path)
+                say(os.path.join(data_path, path), 1)
+
+        if not unlisted:
+            say("No unlisted data files")
+        else:
+            say("Data files not listed in the catalogs:", 1)
+            for path in unlisted:
+                report.warning('unlisted', path)
+                say(os.path.join(data_path, path), 1)
+
+        if multiple:
+            say("Data files listed more than once:", 1)
+            for path in sorted(multiple):
+                report.warning('listed_more_than_once', path, '{} times'.format(multiple[path]))
+                say("{} ({} times)".format(os.path.join(data_path, path), multiple[path]), 1)
+
+    ################################# CHECK ###################################
+
+    if args.load:
+        with report.stage('validate'):
+            present = [path for path in dict.fromkeys(listed_files) if path in existing_files]
+            results, checked = cache.check(data_path, stats, present, args.jobs, scope)
+            report.counts.update({'validated': len(results), 'checked': checked,
+                                  'invalid': sum(1 for path in present if results[path])})
+            say("{} data files, {} checked, {} unchanged"
+                .format(len(results), checked, len(results) - checked))
+            failed = [path for path in present if results[path]]
+            if failed:
+                say("Data files with problems:", 1)
+                for path in sorted(failed):
+                    for message in results[path]:
+                        report.error('invalid', path, message)
+                        say(os.path.join(data_path, path) + ": " + message, 1)
+
+    ################################ FORMULAS #################################
+
+    if args.formulas:
+        with report.stage('formulas'):
+            present = [path for path in dict.fromkeys(listed_files) if path in existing_files]
+            data = load_files([os.path.join(data_path, path) for path in present], args.jobs)[0]
+            blocks, owners = [], []
+            for path, document in data.items():
+                if not isinstance(document, dict) or not isinstance(document.get('DATA'), list):
+                    continue
+                for i, block in enumerate(document['DATA']):
+                    if not isinstance(block, dict) or \
+                            not str(block.get('type', '')).startswith('formula'):
+                        continue
+                    formula, coefficients, error = formula_coefficients(block)
+                    wl_range = wavelength_range(block)[0]
+                    if error or wl_range is None or \
+                            not coefficient_count_ok(formula, len(coefficients)):
+                        continue # reported by the validation
+                    blocks.append((formula, coefficients, wl_range))
+                    owners.append((os.path.relpath(path, data_path).replace(os.sep, '/'),
+                                   i, formula))
+            problems = sweep(blocks)
+            report.counts.update({'formulas': len(blocks),
+                                  'formula_problems': sum(1 for p in problems if p)})
+            say("{} formulas evaluated, {} with problems"
+                .format(len(blocks), sum(1 for p in problems if p)))
+            for (path, i, formula), messages in zip(owners, problems):
+                for message in messages:
+                    message = "DATA[{}] formula {}: {}".format(i, formula, message)
+                    report.error('formula', path, message)
+                    say("{}: {}".format(os.path.join(data_path, path), message), 1)
+
+    ############################### DUPLICATES ################################
+
+    if args.duplicates:
+        with report.stage('duplicates'):
+            ## with -g, all files are compared, groups without a changed file are not shown
+            candidates = sorted(existing_files if scope is None else scan_data(db_path))
+            exact, near = find_duplicates([os.path.join(data_path, path) for path in candidates],
+                                          args.jobs)
+            for check, groups in (("exact_duplicates", exact), ("near_duplicates", near)):
+                groups = [[candidates[i] for i in group] for group in groups]
+                if scope is not None:
+                    groups = [group for group in groups if scope.intersection(group)]
+                report.counts[check] = len(groups)
+                say("{} groups of {}".format(len(groups), check.replace('_', ' ')),
+                    1 if groups else 2)
+                for group in groups:
+                    report.warning(check, group[0], 'same data as ' + ', '.join(group[1:]))
+                    say("  " + ", ".join(os.path.join(data_path, path) for path in group), 1)
+
+    ################################# INDEX ###################################
+
+    if index is not None:
+        with report.stage('index'):
+            digests = cache.digests(data_path, stats, scope)
+            walked, parsed = index.update(db_path, args.catalogs, digests, args.jobs, scope)
+            say("Index {}: {} catalogs walked, {} data files parsed"
+                .format(index.path, walked, parsed))
+            index.close()
+
+    cache.save()
+
+    if args.json:
+        report.write_json(args.json)
+    sys.exit(report.exit_code())
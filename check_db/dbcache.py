@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Persistent check_db state: the pages of every catalog and the check
+# results of every data file, so that later runs only parse what changed.
+#
+#   cache = CheckCache('database/.check_db-cache.json')
+#   pages = cache.catalog('database/', 'catalog-nk.yml')
+#   results, checked = cache.check('database/data', stats, paths)
+#   digests = cache.digests('database/data', stats)   # {path: SHA-1}
+#   cache.save()
+#
+# CheckCache(None) caches nothing between runs.
+#
+# A catalog is walked again when its size or mtime changed. A data file is
+# hashed again when its size or mtime changed, and checked again when its
+# content hash changed too; a changed mtime with the same content (e.g. after
+# a checkout) only updates the cached stat. The content hashes of all data
+# files (digests()) also drive the updates of the metadata index (dbindex.py).
+# Everything cached is dropped when CHECK_VERSION changes.
+
+import os
+import json
+import hashlib
+
+from dbload import load_catalog
+from validate import check_files
+from dbwalk import walk_catalog
+
+CHECK_VERSION = 3 # bump whenever the checks of a data file change
+cache_name = '.check_db-cache.json'
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class CheckCache:
+
+    def __init__(self, path):
+        self.path = path
+        self.catalogs, self.files = {}, {}
+        self.dirty = False
+        if path is None:
+            return # not persistent
+        try:
+            with open(path, encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached['version'] == CHECK_VERSION:
+                self.catalogs, self.files = cached['catalogs'], cached['files']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def catalog(self, db_path, catalog):
+        # [(shelf, book, page, data)] of a catalog
+        st = os.stat(os.path.join(db_path, catalog))
+        key = [st.st_size, st.st_mtime_ns]
+        cached = self.catalogs.get(catalog)
+        if cached is None or cached['key'] != key:
+            pages = list(walk_catalog(load_catalog(db_path, catalog)))
+            self.catalogs[catalog] = cached = {'key': key, 'pages': pages}
+            self.dirty = True
+        return [tuple(page) for page in cached['pages']]
+
+    def _entry(self, data_path, path, size, mtime):
+        # [size, mtime, SHA-1, diagnostics] of a data file, hashed again if
+        # its stat changed; diagnostics are None until it is checked
+        entry = self.files.get(path)
+        if entry is not None and entry[:2] == [size, mtime]:
+            return entry
+        digest = file_hash(os.path.join(data_path, path))
+        if entry is not None and entry[2] == digest:
+            entry[:2] = [size, mtime]
+        else:
+            entry = self.files[path] = [size, mtime, digest, None]
+        self.dirty = True
+        return entry
+
+    def _forget(self, stats, scope):
+        # files that are gone are forgotten; with a scope (a set of paths)
+        # only those in the scope
+        for path in (self.files.keys() if scope is None else
+                     self.files.keys() & scope) - stats.keys():
+            del self.files[path]
+            self.dirty = True
+
+    def check(self, data_path, stats, paths, workers=None, scope=None):
+        # {path: diagnostics} of the given data files (relative to data_path,
+        # stats from scan_data(stat=True)) and the number actually checked
+        results, todo = {}, []
+        for path in paths:
+            entry = self._entry(data_path, path, *stats[path])
+            if entry[3] is None:
+                todo.append(path)
+            else:
+                results[path] = entry[3]
+        checked = check_files([os.path.join(data_path, path) for path in todo], workers)
+        for path, result in zip(todo, checked):
+            self.files[path][3] = results[path] = result
+        self._forget(stats, scope)
+        return results, len(todo)
+
+    def digests(self, data_path, stats, scope=None):
+        # {path: SHA-1} of every data file in stats
+        digests = {path: self._entry(data_path, path, *stats[path])[2] for path in stats}
+        self._forget(stats, scope)
+        return digests
+
+    def save(self):
+        if not self.dirty or self.path is None:
+            return
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': CHECK_VERSION, 'catalogs': self.catalogs,
+                       'files': self.files}, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Change scope of a git revision range, for checking only what a commit
+# (or a branch, or the working tree) touched.
+#
+#   changed = changed_files('database/', 'HEAD~1..HEAD')   # paths relative to database/
+#   scope = change_scope(changed, catalogs)   # data paths, or None: check everything
+#   pages = reverse_index(cache.catalog(...)) # {data path: [(shelf, book, page), ...]}
+#   stats = stat_files('database/', scope)     # as scan_data(stat=True), scope only
+#
+# The revisions are passed to `git diff --name-only` as they are, so a
+# range (A..B, A...B), one revision (against the working tree) or two
+# revisions all work. Renames are reported as a deletion and an addition,
+# so that the old path is checked too. When a catalog changed, catalog-wide
+# invariants (missing, unlisted and repeated files) can change anywhere and
+# the whole database has to be checked.
+
+import os
+import subprocess
+
+
+def changed_files(db_path, revisions):
+    # paths (relative to db_path, '/' separators) changed in a revision range;
+    # ValueError with git's message if git fails
+    result = subprocess.run(['git', '-C', db_path, 'diff', '--name-only', '--relative',
+                             '--no-renames', '-z'] + revisions.split() + ['--'],
+                            capture_output=True)
+    if result.returncode:
+        raise ValueError(result.stderr.decode('utf-8', 'replace').strip())
+    return [path for path in result.stdout.decode('utf-8').split('\0') if path]
+
+
+def change_scope(changed, catalogs):
+    # changed data files (relative to data/), or None if a catalog changed
+    if set(changed) & set(catalogs):
+        return None
+    return {path[len('data/'):] for path in changed
+            if path.startswith('data/') and path.endswith('.yml')}
+
+
+def stat_files(db_path, paths):
+    # {path: (size, mtime_ns)} of the given data files that exist, as
+    # scan_data(stat=True) for the whole tree
+    stats = {}
+    for path in paths:
+        try:
+            st = os.stat(os.path.join(db_path, 'data', path))
+        except OSError:
+            continue
+        stats[path] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+
+def reverse_index(pages):
+    # {data path: [page, ...]} of pages given as (..., data) tuples, the
+    # page being the tuple without its data path
+    index = {}
+    for *page, data in pages:
+        index.setdefault(data, []).append(tuple(page))
+    return index
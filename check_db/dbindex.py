@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# SQLite index of the database metadata, with full-text search.
+#
+#   python dbindex.py database/ ZnSe                 (update the index, search)
+#   python dbindex.py database/ 'Adachi' --sql 'SELECT ...'
+#
+#   index = DBIndex('database/catalog-index.sqlite')
+#   index.update('database/', digests=cache.digests('database/data', stats))
+#   for row in index.search('ZnSe'): ...   # (catalog, shelf, book, page, data)
+#
+# Tables: pages (catalog, shelf, book, page ids and names, dividers, data
+# path), files (data path, SHA-1, references, comments, block types, overall
+# wavelength range) and catalogs (size, mtime). Two FTS5
+# tables, page_text (ids and names of shelf, book and page, dividers) and
+# file_text (references and comments, HTML tags stripped), share rowids with
+# pages and files.
+#
+# A catalog is walked again when its size or mtime changed. The state of
+# the data files comes from the check_db cache (dbcache.CheckCache.digests):
+# a file is parsed again when its content hash differs from the one in the
+# index, files that are gone are deleted. Everything is rebuilt when
+# index_version changes.
+#
+# The index is marked by the SQLite application_id. DBIndex creates the file
+# if it does not exist and only ever rebuilds an index; any other file is
+# refused with a ValueError and left alone.
+
+import os
+import re
+import json
+import sqlite3
+
+import numpy as np
+import yaml
+
+from dbcache import CheckCache, cache_name
+from dbload import load_yaml, load_catalog, map_chunks
+from dbwalk import default_catalogs, walk_catalog, scan_data
+from validate import tabulated_columns, parse_table, wavelength_range
+
+index_version = 3
+application_id = 0x52494458 # 'RIDX'
+sqlite_magic = b'SQLite format 3\0'
+index_name = 'catalog-index.sqlite'
+
+schema = """
+CREATE TABLE catalogs (catalog TEXT PRIMARY KEY, size INTEGER, mtime INTEGER);
+CREATE TABLE pages (id INTEGER PRIMARY KEY, catalog TEXT, shelf TEXT, book TEXT,
+                    page TEXT, shelf_name TEXT, book_name TEXT, page_name TEXT,
+                    book_divider TEXT, page_divider TEXT, data TEXT);
+CREATE INDEX pages_catalog ON pages (catalog);
+CREATE INDEX pages_data ON pages (data);
+CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, sha1 TEXT,
+                    refs TEXT, comments TEXT, types TEXT, wl_min REAL,
+                    wl_max REAL);
+CREATE VIRTUAL TABLE page_text USING fts5 (shelf, book, page, dividers);
+CREATE VIRTUAL TABLE file_text USING fts5 (refs, comments);
+"""
+
+_tag = re.compile(r'<[^>]*>')
+
+
+def _text(value):
+    return _tag.sub(' ', value) if isinstance(value, str) else ''
+
+
+def file_metadata(path):
+    # (references, comments, types, wl_min, wl_max) of a data file; a file
+    # that cannot be read gets empty metadata (check_db -l reports it)
+    try:
+        document = load_yaml(path)
+    except (OSError, yaml.YAMLError, UnicodeDecodeError):
+        return None, None, None, None, None
+    if not isinstance(document, dict):
+        return None, None, None, None, None
+    types, lo, hi = [], np.inf, -np.inf
+    blocks = document.get('DATA')
+    for block in blocks if isinstance(blocks, list) else []:
+        kind = block.get('type') if isinstance(block, dict) else None
+        if not isinstance(kind, str):
+            continue
+        types.append(kind.strip())
+        if kind in tabulated_columns:
+            table = parse_table(block.get('data'), len(tabulated_columns[kind]))[0]
+            wl = table[:, 0] if table is not None else []
+        else:
+            wl = wavelength_range(block)[0] or []
+        if len(wl):
+            lo, hi = min(lo, np.min(wl)), max(hi, np.max(wl))
+    references, comments = document.get('REFERENCES'), document.get('COMMENTS')
+    return (str(references) if references is not None else None,
+            str(comments) if comments is not None else None,
+            ', '.join(types),
+            float(lo) if np.isfinite(lo) else None,
+            float(hi) if np.isfinite(hi) else None)
+
+
+def metadata(paths, workers=None):
+    return map_chunks(file_metadata, paths, workers)
+
+
+class DBIndex:
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                if f.read(len(sqlite_magic)) != sqlite_magic:
+                    raise ValueError('{}: not an SQLite database'.format(path))
+            self.db = sqlite3.connect(path)
+            if self.db.execute('PRAGMA application_id').fetchone()[0] != application_id:
+                self.db.close()
+                raise ValueError('{}: not a database index'.format(path))
+            if self.db.execute('PRAGMA user_version').fetchone()[0] == index_version:
+                return
+            self.db.close()
+            os.remove(path)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(schema)
+        self.db.execute('PRAGMA application_id = {}'.format(application_id))
+        self.db.execute('PRAGMA user_version = {}'.format(index_version))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, db_path, catalogs=default_catalogs, digests=None, workers=None,
+               scope=None):
+        # bring the index up to date; returns (catalogs walked, files parsed).
+        # digests: {data path: SHA-1} from CheckCache.digests(), of every data
+        # file or, with a scope (a set of data paths), of those only; then
+        # only those files are updated. Without digests, every file is hashed.
+        db = self.db
+        walked = 0
+        with db:
+            known = {row[0] for row in db.execute('SELECT catalog FROM catalogs')}
+            for catalog in known - set(catalogs):
+                self._drop_pages(catalog)
+                db.execute('DELETE FROM catalogs WHERE catalog = ?', (catalog,))
+            for catalog in catalogs:
+                st = os.stat(os.path.join(db_path, catalog))
+                key = (st.st_size, st.st_mtime_ns)
+                row = db.execute('SELECT size, mtime FROM catalogs WHERE catalog = ?',
+                                 (catalog,)).fetchone()
+                if row == key:
+                    continue
+                self._drop_pages(catalog)
+                for shelf, book, page, data, names in \
+                        walk_catalog(load_catalog(db_path, catalog), names=True):
+                    rowid = db.execute(
+                        'INSERT INTO pages (catalog, shelf, book, page, shelf_name,'
+                        ' book_name, page_name, book_divider, page_divider, data)'
+                        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (catalog, shelf, book, page) + names + (data,)).lastrowid
+                    text = [' '.join(str(s) for s in item if s is not None) for item in
+                            ((shelf, names[0]), (book, names[1]), (page, names[2]), names[3:])]
+                    db.execute('INSERT INTO page_text (rowid, shelf, book, page, dividers)'
+                               ' VALUES (?, ?, ?, ?, ?)', [rowid] + text)
+                db.execute('INSERT OR REPLACE INTO catalogs VALUES (?, ?, ?)',
+                           (catalog,) + key)
+                walked += 1
+
+        data_path = os.path.join(db_path, 'data')
+        if digests is None:
+            digests = CheckCache(None).digests(data_path, scan_data(db_path, stat=True))
+        files = dict(db.execute('SELECT path, sha1 FROM files'))
+        todo = [path for path, digest in digests.items() if files.get(path) != digest]
+        parsed = metadata([os.path.join(data_path, path) for path in todo], workers)
+        with db:
+            for path in (files.keys() if scope is None else
+                         files.keys() & scope) - digests.keys():
+                self._drop_file(path)
+            for path, meta in zip(todo, parsed):
+                self._drop_file(path)
+                rowid = db.execute(
+                    'INSERT INTO files (path, sha1, refs, comments, types, wl_min,'
+                    ' wl_max) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (path, digests[path]) + tuple(meta)).lastrowid
+                db.execute('INSERT INTO file_text (rowid, refs, comments) VALUES (?, ?, ?)',
+                           (rowid, _text(meta[0]), _text(meta[1])))
+        return walked, len(todo)
+
+    def _drop_pages(self, catalog):
+        self.db.execute('DELETE FROM page_text WHERE rowid IN'
+                        ' (SELECT id FROM pages WHERE catalog = ?)', (catalog,))
+        self.db.execute('DELETE FROM pages WHERE catalog = ?', (catalog,))
+
+    def _drop_file(self, path):
+        self.db.execute('DELETE FROM file_text WHERE rowid IN'
+                        ' (SELECT id FROM files WHERE path = ?)', (path,))
+        self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def search(self, query):
+        # pages whose ids, names or dividers, or whose data file's references
+        # or comments match an FTS5 query: (catalog, shelf, book, page, data).
+        # A query with a column filter (page:dup) searches only the table
+        # that has that column.
+        ids, errors = set(), []
+        for sql in ('SELECT rowid FROM page_text WHERE page_text MATCH ?',
+                    'SELECT pages.id FROM file_text JOIN files ON files.id = file_text.rowid'
+                    ' JOIN pages ON pages.data = files.path WHERE file_text MATCH ?'):
+            try:
+                ids.update(row[0] for row in self.db.execute(sql, (query,)))
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+        if len(errors) == 2:
+            raise errors[0]
+        return self.db.execute(
+            'SELECT catalog, shelf, book, page, data FROM pages'
+            ' WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id',
+            (json.dumps(sorted(ids)),)).fetchall()
+
+
+if __name__ == "__main__":
+    import argparse, time
+    parser = argparse.ArgumentParser(description="""
+                                     Updates the SQLite metadata index of the
+                                     database and searches it.
+                                     """)
+    parser.add_argument('database', help='database root directory (database/)')
+    parser.add_argument('query', nargs='?', help='FTS5 query (e.g. ZnSe, "Adachi", Si*)')
+    parser.add_argument('-i', '--index', default=None,
+                        help='index file (default: database/' + index_name + ')')
+    parser.add_argument('-c', '--catalogs', nargs='+', default=default_catalogs)
+    parser.add_argument('--sql', default=None, help='run an SQL query on the index')
+    parser.add_argument('--cache', default=None,
+                        help='check_db cache file (default: database/' + cache_name + ')')
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        index = DBIndex(args.index or os.path.join(args.database, index_name))
+    except (ValueError, sqlite3.DatabaseError) as e:
+        parser.error(str(e))
+    t = time.perf_counter()
+    cache = CheckCache(args.cache or os.path.join(args.database, cache_name))
+    digests = cache.digests(os.path.join(args.database, 'data'),
+                            scan_data(args.database, stat=True))
+    walked, parsed = index.update(args.database, args.catalogs, digests, args.jobs)
+    cache.save()
+    print('{} catalogs walked, {} data files parsed in {:.3f} s'
+          .format(walked, parsed, time.perf_counter() - t))
+    if args.query:
+        t = time.perf_counter()
+        rows = index.search(args.query)
+        for catalog, shelf, book, page, data in rows:
+            print('{}: {}/{}/{} -> {}'.format(catalog, shelf, book, page, data))
+        print('{} pages in {:.1f} ms'.format(len(rows), (time.perf_counter() - t)*1e3))
+    if args.sql:
+        for row in index.db.execute(args.sql):
+            print('\t'.join(map(str, row)))
+    index.close()
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# YAML loading for check_db: the libyaml C loader when PyYAML was built with
+# it, and a process pool for loading many data files.
+#
+#   library = load_catalog('database/', 'catalog-nk.yml')
+#   data, errors = load_files(paths)    # {path: document}, {path: message}
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+chunksize = 64   # files per work unit
+min_parallel = 256 # fewer files are loaded in this process
+
+
+def load_yaml(path):
+    with open(path, 'rb') as f:
+        return yaml.load(f, Loader=Loader)
+
+
+def load_catalog(db_path, catalog):
+    return load_yaml(os.path.join(db_path, catalog))
+
+
+def map_chunks(function, items, workers=None):
+    # [function(item) for item in items], in chunks on a process pool
+    items = list(items)
+    chunks = [items[i:i+chunksize] for i in range(0, len(items), chunksize)]
+    if workers == 1 or len(items) < min_parallel:
+        results = map(_apply, [function]*len(chunks), chunks)
+        return [r for chunk in results for r in chunk]
+    with ProcessPoolExecutor(workers) as pool:
+        results = pool.map(_apply, [function]*len(chunks), chunks)
+        return [r for chunk in results for r in chunk]
+
+
+def _apply(function, items):
+    return [function(item) for item in items]
+
+
+def _load(path):
+    # (document, None) or (None, error message)
+    try:
+        return load_yaml(path), None
+    except (OSError, yaml.YAMLError, UnicodeDecodeError) as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+
+def load_files(paths, workers=None):
+    # Loads every file once, even if listed several times. Returns the
+    # documents and the errors, both keyed by path; workers=1 loads serially.
+    paths = list(dict.fromkeys(paths))
+    data, errors = {}, {}
+    for path, (document, error) in zip(paths, map_chunks(_load, paths, workers)):
+        if error is None:
+            data[path] = document
+        else:
+            errors[path] = error
+    return data, errors
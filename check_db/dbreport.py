@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Results of a check_db run: problems, counts and the time and memory of
+# every stage, printed as they come or written out as JSON.
+#
+#   report = Report(verbosity=2)
+#   with report.stage('validate'):
+#       report.error('invalid', path, message)
+#   report.say('summary line')          # printed with verbosity 2
+#   report.say('problem line', 1)       # printed with verbosity 1 (quiet) too
+#   report.write_json('report.json')    # '-' for stdout
+#   sys.exit(report.exit_code())
+#
+# Errors (missing or invalid data files, formula problems) make the exit
+# code 1; warnings (unlisted files, files listed twice, duplicates) do not.
+# Peak memory is the resident set size high-water mark after each stage, of
+# this process and of the largest worker process, in MiB (None where the
+# resource module is not available).
+
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+
+def peak_memory():
+    # (this process, largest child process) peak resident set size [MiB]
+    if resource is None:
+        return None, None
+    unit = 1 if sys.platform == 'darwin' else 1024 # ru_maxrss: bytes on macOS, else KiB
+    return tuple(round(resource.getrusage(who).ru_maxrss*unit/2**20, 1)
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+class Report:
+
+    def __init__(self, verbosity=2):
+        # 2: everything, 1: problems only, 0: nothing
+        self.verbosity = verbosity
+        self.errors, self.warnings = [], []
+        self.counts, self.catalogs, self.stages = {}, {}, {}
+
+    def say(self, line='', level=2):
+        if self.verbosity >= level:
+            print(line)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'seconds': 0.0})
+            entry['seconds'] = round(entry['seconds'] + time.perf_counter() - start, 4)
+            entry['peak_memory'], entry['peak_memory_workers'] = peak_memory()
+
+    def _problem(self, problems, check, path, message):
+        problem = {'check': check, 'path': path}
+        if message is not None:
+            problem['message'] = message
+        problems.append(problem)
+
+    def error(self, check, path, message=None):
+        self._problem(self.errors, check, path, message)
+
+    def warning(self, check, path, message=None):
+        self._problem(self.warnings, check, path, message)
+
+    def exit_code(self):
+        return 1 if self.errors else 0
+
+    def as_dict(self):
+        return {'exit_code': self.exit_code(), 'counts': self.counts,
+                'catalogs': self.catalogs, 'stages': self.stages,
+                'errors': self.errors, 'warnings': self.warnings}
+
+    def write_json(self, path):
+        if path == '-':
+            json.dump(self.as_dict(), sys.stdout, indent=1)
+            print()
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.as_dict(), f, indent=1)
@@ -0,0 +1,288 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Compiled, memory-mapped snapshot of the database for runtime queries.
+#
+#   python dbstore.py compile database/            (-> database/database.dbstore)
+#   python dbstore.py query database/ main/Ag/nk/Johnson.yml 0.5 0.6
+#
+#   store = DBStore('database/database.dbstore')
+#   row = store.find('main/Ag/nk/Johnson.yml')    # or store.page('main', 'Ag', 'Johnson')
+#   n, k = store.nk(row, [0.5, 0.6])
+#
+# File layout (as agf2yml/agfstore.py): 8-byte magic, uint32 format version,
+# uint32 header length, a JSON header and 64-byte aligned arrays, all mapped
+# read-only with np.memmap on open. One row per data file: tabulated n and k
+# points are packed into contiguous (λ, value) arrays with offset tables
+# (tabulated nk is split into both), the formula of the file into a formula
+# code, a zero-padded coefficient row and a range. Pages (catalog, shelf,
+# book, page) refer to file rows; data paths and page keys have sorted
+# copies for binary search. n comes from the formula if there is one,
+# otherwise from the n table; k from the k table, 0 without one. Outside
+# the data NaN is returned. Files of tabulated n2 (nonlinear index) are
+# marked as such: nk() refuses them, n2() interpolates them.
+
+import os
+import json
+import struct
+
+import numpy as np
+
+from dbload import load_catalog, load_files
+from dbwalk import default_catalogs, walk_catalog
+from validate import parse_table, formula_coefficients, wavelength_range, \
+                     coefficient_count_ok
+from formulas import evaluate, max_coefficients
+
+magic = b'DBSTORE\0'
+store_version = 2
+store_name = 'database.dbstore'
+kind_nk, kind_n2 = 0, 1 # what the n table and formula of a file describe
+
+
+def _strings(values):
+    # UTF-8 blob and offsets of a list of strings
+    data = [v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(data)+1, np.int64)
+    offsets[1:] = np.cumsum([len(d) for d in data])
+    return np.frombuffer(b''.join(data), np.uint8), offsets
+
+
+def _sorted(values):
+    keys = np.array([v.encode('utf-8') for v in values] or [b''])[:len(values)]
+    order = np.argsort(keys, kind='stable')
+    return keys[order], order.astype(np.int32)
+
+
+def data_contents(document):
+    # n table, k table, (formula, coefficients, range) of a data file, and
+    # whether the n table holds n2 (tabulated n2) rather than n
+    n_table = k_table = formula = None
+    n2 = False
+    blocks = document.get('DATA') if isinstance(document, dict) else None
+    for block in blocks if isinstance(blocks, list) else []:
+        kind = block.get('type') if isinstance(block, dict) else None
+        if kind in ('tabulated n', 'tabulated n2') and n_table is None:
+            n_table = parse_table(block.get('data'), 2)[0]
+            n2 = kind == 'tabulated n2'
+        elif kind == 'tabulated k' and k_table is None:
+            k_table = parse_table(block.get('data'), 2)[0]
+        elif kind == 'tabulated nk' and n_table is None:
+            table = parse_table(block.get('data'), 3)[0]
+            if table is not None:
+                n_table, k_table = table[:, :2], table[:, [0, 2]]
+        elif isinstance(kind, str) and kind.startswith('formula') and formula is None:
+            code, coefficients, error = formula_coefficients(block)
+            wl_range = wavelength_range(block)[0]
+            if not error and wl_range and coefficient_count_ok(code, len(coefficients)):
+                formula = code, coefficients[:max_coefficients], wl_range
+    return n_table, k_table, formula, n2
+
+
+def _packed(tables):
+    # offsets and (points, 2) array of a list of tables (None: no points)
+    tables = [np.zeros((0, 2)) if t is None else t[np.argsort(t[:, 0], kind='stable')]
+              for t in tables]
+    offsets = np.zeros(len(tables)+1, np.int64)
+    offsets[1:] = np.cumsum([len(t) for t in tables])
+    return offsets, np.concatenate(tables + [np.zeros((0, 2))])
+
+
+def compile_store(db_path, path=None, catalogs=default_catalogs, workers=None):
+    path = path or os.path.join(db_path, store_name)
+    pages = [(catalog,) + page for catalog in catalogs
+             for page in walk_catalog(load_catalog(db_path, catalog))]
+    files = list(dict.fromkeys(page[4] for page in pages))
+    data_path = os.path.join(db_path, 'data')
+    documents = load_files([os.path.join(data_path, f) for f in files], workers)[0]
+    contents = [data_contents(documents.get(os.path.join(data_path, f))) for f in files]
+    F = len(files)
+    formula = np.zeros(F, np.int16)
+    coefficients = np.zeros((F, max_coefficients))
+    wl_range = np.full((F, 2), np.nan)
+    for i, (n_table, k_table, f, n2) in enumerate(contents):
+        if f is not None:
+            formula[i] = f[0]
+            coefficients[i, :len(f[1])] = f[1]
+            wl_range[i] = f[2]
+    arrays = {'formula': formula, 'coefficients': coefficients, 'range': wl_range,
+              'kind': np.array([kind_n2 if c[3] else kind_nk for c in contents], np.int8),
+              'loaded': np.array([os.path.join(data_path, f) in documents
+                                  for f in files], bool)}
+    arrays['n_offsets'], arrays['n_points'] = _packed([c[0] for c in contents])
+    arrays['k_offsets'], arrays['k_points'] = _packed([c[1] for c in contents])
+    arrays['file_blob'], arrays['file_offsets'] = _strings(files)
+    arrays['file_sorted'], arrays['file_order'] = _sorted(files)
+    file_row = {f: i for i, f in enumerate(files)}
+    arrays['page_file'] = np.array([file_row[p[4]] for p in pages], np.int32)
+    arrays['page_catalog'] = np.array([catalogs.index(p[0]) for p in pages], np.int16)
+    keys = ['/'.join(p[1:4]) for p in pages]
+    arrays['page_blob'], arrays['page_offsets'] = _strings(keys)
+    arrays['page_sorted'], arrays['page_order'] = _sorted(keys)
+
+    header = {'version': store_version, 'catalogs': list(catalogs), 'arrays': {}}
+    offset = 0
+    for key, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        arrays[key] = a
+        header['arrays'][key] = {'dtype': a.dtype.str, 'shape': a.shape,
+                                 'offset': offset}
+        offset += -(-a.nbytes // 64) * 64
+    head = json.dumps(header).encode('utf-8')
+    start = -(-(len(magic) + 8 + len(head)) // 64) * 64
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(magic + struct.pack('<II', store_version, len(head)) + head)
+        for key, a in arrays.items():
+            f.seek(start + header['arrays'][key]['offset'])
+            f.write(a.tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+    return path
+
+
+class DBStore:
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            head = f.read(len(magic) + 8)
+            if head[:len(magic)] != magic:
+                raise ValueError('{}: not a database store'.format(path))
+            version, length = struct.unpack('<II', head[len(magic):])
+            if version != store_version:
+                raise ValueError('{}: store version {}, expected {}'
+                                 .format(path, version, store_version))
+            self.header = json.loads(f.read(length))
+        self.path = path
+        self.catalogs = self.header['catalogs']
+        start = -(-(len(magic) + 8 + length) // 64) * 64
+        self._map = np.memmap(path, np.uint8, 'r')
+        for key, spec in self.header['arrays'].items():
+            setattr(self, key, np.ndarray(tuple(spec['shape']), spec['dtype'],
+                                          self._map, start + spec['offset']))
+
+    def __len__(self):
+        return len(self.formula)
+
+    def _string(self, field, row):
+        offsets = getattr(self, field + '_offsets')
+        blob = getattr(self, field + '_blob')
+        return blob[offsets[row]:offsets[row+1]].tobytes().decode('utf-8')
+
+    def _search(self, field, key):
+        keys, order = getattr(self, field + '_sorted'), getattr(self, field + '_order')
+        key = key.encode('utf-8')
+        i = np.searchsorted(keys, np.array(key, keys.dtype))
+        if i < len(keys) and keys[i] == key:
+            return int(order[i])
+        raise KeyError(key.decode('utf-8'))
+
+    def data_path(self, row):
+        return self._string('file', row)
+
+    def find(self, data_path):
+        # file row of a data path relative to data/
+        return self._search('file', data_path)
+
+    def page(self, shelf, book, page):
+        # file row of a catalog page
+        return int(self.page_file[self._search('page', '/'.join((shelf, book, page)))])
+
+    def tables(self, row):
+        # (λ, n) and (λ, k) points of a file, sorted by wavelength
+        n = self.n_points[self.n_offsets[row]:self.n_offsets[row+1]]
+        k = self.k_points[self.k_offsets[row]:self.k_offsets[row+1]]
+        return n, k
+
+    def nk(self, row, wl):
+        # n and k of a file at wavelengths wl [μm]
+        if self.kind[row] == kind_n2:
+            raise ValueError('{}: n2 data, not n and k'.format(self.data_path(row)))
+        wl = np.atleast_1d(np.asarray(wl, float))
+        n_points, k_points = self.tables(row)
+        if self.formula[row]:
+            n = evaluate(int(self.formula[row]), self.coefficients[row:row+1],
+                         wl[np.newaxis, :])[0][0]
+            lo, hi = self.range[row]
+            n[(wl < lo) | (wl > hi)] = np.nan
+        elif len(n_points):
+            n = np.interp(wl, n_points[:, 0], n_points[:, 1], np.nan, np.nan)
+        else:
+            n = np.full(wl.shape, np.nan)
+        if len(k_points):
+            k = np.interp(wl, k_points[:, 0], k_points[:, 1], np.nan, np.nan)
+        else:
+            k = np.where(np.isnan(n), np.nan, 0.0)
+        return n, k
+
+    def n2(self, row, wl):
+        # nonlinear index n2 of a file of tabulated n2 at wavelengths wl [μm]
+        if self.kind[row] != kind_n2:
+            raise ValueError('{}: not n2 data'.format(self.data_path(row)))
+        points = self.tables(row)[0]
+        return np.interp(wl, points[:, 0], points[:, 1], np.nan, np.nan)
+
+    def bad_formulas(self):
+        # rows whose formula n is not finite at a range end or at 1 μm (where
+        # absent terms used to give 0/0)
+        bad = []
+        for row in np.flatnonzero(self.formula):
+            lo, hi = self.range[row]
+            n = self.nk(row, [lo, min(max(1.0, lo), hi), hi])[0]
+            if not np.isfinite(n).all():
+                bad.append(int(row))
+        return bad
+
+
+if __name__ == "__main__":
+    import argparse, time
+    parser = argparse.ArgumentParser(description="""
+                                     Compiles the database into one
+                                     memory-mapped file, or queries it.
+                                     """)
+    parser.add_argument('command', choices=['compile', 'query'])
+    parser.add_argument('database', help='database root directory (database/)')
+    parser.add_argument('page', nargs='?', help='data path, or shelf/book/page')
+    parser.add_argument('wavelengths', nargs='*', type=float, help='[μm]')
+    parser.add_argument('-o', '--output', default=None,
+                        help='store file (default: database/' + store_name + ')')
+    parser.add_argument('-c', '--catalogs', nargs='+', default=default_catalogs)
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    args = parser.parse_args()
+    path = args.output or os.path.join(args.database, store_name)
+
+    if args.command == 'compile':
+        t = time.perf_counter()
+        compile_store(args.database, path, args.catalogs, args.jobs)
+        t = time.perf_counter() - t
+        store = DBStore(path)
+        print('{}: {} data files, {} pages, {} n and {} k points, {:.0f} kB, '
+              'compiled in {:.2f} s'.format(path, len(store), len(store.page_file),
+                                            len(store.n_points), len(store.k_points),
+                                            os.path.getsize(path)/1024, t))
+        bad = store.bad_formulas()
+        print('{} formulas with n not finite at 1 μm or a range end'.format(len(bad)))
+        for row in bad:
+            print('  ' + store.data_path(row))
+    else:
+        t = time.perf_counter()
+        store = DBStore(path)
+        t_open = time.perf_counter() - t
+        t = time.perf_counter()
+        try:
+            row = store.find(args.page)
+        except KeyError:
+            row = store.page(*args.page.split('/'))
+        if store.kind[row] == kind_n2:
+            n2 = store.n2(row, args.wavelengths)
+            t_query = time.perf_counter() - t
+            print(store.data_path(row))
+            for wl, value in zip(args.wavelengths, n2):
+                print('  {:.4f} μm  n2={:.4e}'.format(wl, value))
+        else:
+            n, k = store.nk(row, args.wavelengths)
+            t_query = time.perf_counter() - t
+            print(store.data_path(row))
+            for wl, ni, ki in zip(args.wavelengths, n, k):
+                print('  {:.4f} μm  n={:.6f}  k={:.4e}'.format(wl, ni, ki))
+        print('opened in {:.0f} μs, queried in {:.0f} μs'.format(t_open*1e6, t_query*1e6))
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Catalog traversal and data/ tree index for check_db.
+#
+#   for shelf, book, page, data in walk_catalog(library): ...
+#   for shelf, book, page, data, names in walk_catalog(library, names=True): ...
+#   existing = scan_data('database/')          # {'main/Ag/nk/Johnson.yml', ...}
+#   stats = scan_data('database/', stat=True)  # {path: (size, mtime_ns)}
+#   missing, unlisted, multiple = compare(listed, existing)
+#
+# Data files are identified by their path relative to data/, with '/'
+# separators, as written in the catalogs.
+
+import os
+import posixpath
+from collections import Counter
+
+default_catalogs = ['catalog-nk.yml', 'catalog-n2.yml']
+
+
+def walk_catalog(library, names=False):
+    # (shelf, book, page, data) of every page of a catalog, in order;
+    # dividers and other entries are skipped. With names, a fifth item holds
+    # the display names of shelf, book and page and the dividers above the
+    # book (in the shelf) and above the page (in the book), None if absent.
+    for shelf in library or []:
+        if "SHELF" not in shelf:
+            continue
+        book_divider = None
+        for book in shelf.get("content") or []:
+            if "DIVIDER" in book:
+                book_divider = book["DIVIDER"]
+            if "BOOK" not in book:
+                continue
+            page_divider = None
+            for page in book.get("content") or []:
+                if "DIVIDER" in page:
+                    page_divider = page["DIVIDER"]
+                elif "PAGE" in page:
+                    item = shelf["SHELF"], book["BOOK"], page["PAGE"], \
+                           posixpath.normpath(page["data"])
+                    if names:
+                        item += (shelf.get("name"), book.get("name"), page.get("name"),
+                                 book_divider, page_divider),
+                    yield item
+
+
+def scan_data(db_path, suffix='.yml', stat=False):
+    # relative paths of all files below data/, one os.scandir per directory;
+    # with stat, a dict of their (size, mtime_ns)
+    found = {} if stat else set()
+    stack = ['']
+    root = os.path.join(db_path, 'data')
+    while stack:
+        rel = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, rel))
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                path = rel + '/' + entry.name if rel else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path)
+                elif not entry.name.endswith(suffix):
+                    continue
+                elif stat:
+                    st = entry.stat()
+                    found[path] = (st.st_size, st.st_mtime_ns)
+                else:
+                    found.add(path)
+    return found
+
+
+def compare(listed, existing):
+    # listed: data paths of all pages (repeats included), existing: set of
+    # files on disk. Returns listed-but-missing, present-but-unlisted and
+    # {path: count} of files listed more than once.
+    counts = Counter(listed)
+    missing = counts.keys() - existing
+    unlisted = existing - counts.keys()
+    multiple = {path: n for path, n in counts.items() if n > 1}
+    return sorted(missing), sorted(unlisted), multiple
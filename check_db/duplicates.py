@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Exact and near-duplicate data files.
+#
+#   exact, near = find_duplicates(paths)   # groups of indices into paths
+#
+# Exact duplicates have the same normalized content: the numbers of their
+# tabulated data (parsed, sorted by wavelength, so formatting and comments
+# do not matter) and of their formula (type, coefficients, range) are hashed.
+#
+# Near duplicates have close curves: n and k resampled on grid_points
+# log-spaced wavelengths spanning the file's range, plus the logarithms of
+# the range ends. Two files are near duplicates if their curves differ
+# nowhere by more than n_tolerance in n, log_step in log10(k + k_floor) and
+# log10(n2), and range_step in the range ends. Candidates come from
+# fingerprints, the curves quantized in units of n_step, log_step and
+# range_step: pairs whose fingerprints differ by at most one unit everywhere
+# are then checked against the unquantized curves. Candidates are found
+# with E2LSH (p-stable locality-sensitive hashing): `tables` hash tables,
+# each keyed by `projections` values floor((a·v + b)/width) with Gaussian
+# a, so only fingerprints sharing a bucket in some table are compared, not
+# all N² pairs. Exact duplicates are merged before that.
+
+import hashlib
+
+import numpy as np
+import yaml
+
+from dbload import load_yaml, map_chunks
+from dbstore import data_contents
+from formulas import evaluate, max_coefficients
+
+grid_points = 32
+n_tolerance = 1e-4  # largest difference in n of near duplicates
+n_step = 1e-3       # quantization steps: n,
+log_step = 0.05     # log10(k + k_floor) and log10(n2),
+k_floor = 1e-5
+range_step = 0.02   # and the natural logarithms of the range ends
+tables = 10         # E2LSH: hash tables,
+projections = 4     # projections per table
+width = 4           # and bucket width, times the fingerprint length's square root
+
+
+def signature(path):
+    # (content hash, (fingerprint, curve), n2) of a data file, n2 telling
+    # whether it holds n2 rather than n, k; (None, None, None) if it has no
+    # usable data
+    try:
+        document = load_yaml(path)
+    except (OSError, yaml.YAMLError, UnicodeDecodeError):
+        return None, None, None
+    n_table, k_table, formula, n2 = data_contents(document)
+    if n_table is None and k_table is None and formula is None:
+        return None, None, None
+    digest = hashlib.sha1(b'n2' if n2 else b'nk')
+    for table in (n_table, k_table):
+        digest.update(b'|')
+        if table is not None:
+            digest.update(np.ascontiguousarray(
+                table[np.argsort(table[:, 0], kind='stable')]).tobytes())
+    if formula is not None:
+        digest.update('|{}|'.format(formula[0]).encode())
+        digest.update(np.asarray(formula[1], float).tobytes())
+        digest.update(np.asarray(formula[2], float).tobytes())
+    return digest.hexdigest(), fingerprint(n_table, k_table, formula, n2), n2
+
+
+def fingerprint(n_table, k_table, formula, n2=False):
+    # quantized fingerprint (int16 array) and the curve it quantizes, in
+    # units of the tolerances (n_tolerance, log_step, range_step); None if it
+    # is not finite
+    ranges = [(t[:, 0].min(), t[:, 0].max()) for t in (n_table, k_table) if t is not None]
+    if formula is not None:
+        ranges.append(formula[2])
+    lo, hi = min(r[0] for r in ranges), max(r[1] for r in ranges)
+    if not 0 < lo <= hi:
+        return None
+    wl = np.geomspace(lo, hi, grid_points)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if formula is not None:
+            C = np.zeros((1, max_coefficients))
+            C[0, :len(formula[1])] = formula[1]
+            n = evaluate(formula[0], C, np.clip(wl, *formula[2])[np.newaxis])[0][0]
+        elif n_table is not None:
+            n = _resample(n_table, wl)
+        else:
+            n = np.ones(grid_points)
+        k = _resample(k_table, wl) if k_table is not None else np.zeros(grid_points)
+        v = np.concatenate([np.log10(np.abs(n))/log_step if n2 else n/n_step,
+                            np.log10(np.maximum(k, 0) + k_floor)/log_step,
+                            np.log([lo, hi])/range_step])
+    if not np.isfinite(v).all() or np.abs(v).max() > 32000:
+        return None
+    curve = v.copy()
+    if not n2:
+        curve[:grid_points] *= n_step/n_tolerance
+    return np.rint(v).astype(np.int16), curve
+
+
+def _resample(table, wl):
+    order = np.argsort(table[:, 0], kind='stable')
+    return np.interp(wl, table[order, 0], table[order, 1])
+
+
+def _groups(pairs, count):
+    # connected components (of more than one item) of a graph given by pairs
+    parent = np.arange(count)
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i, j in pairs:
+        a, b = root(i), root(j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    groups = {}
+    for i in range(count):
+        groups.setdefault(root(i), []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def buckets(Q, tables=tables, projections=projections, seed=0):
+    # E2LSH buckets (index arrays, more than one item) of the rows of Q
+    rng = np.random.default_rng(seed)
+    w = width*np.sqrt(Q.shape[1])
+    A = rng.standard_normal((Q.shape[1], tables*projections))
+    b = rng.uniform(0, w, tables*projections)
+    H = np.floor((Q.astype(float) @ A + b)/w).astype(np.int64)
+    for t in range(tables):
+        keys = H[:, t*projections:(t+1)*projections]
+        _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)])
+        for g in np.flatnonzero(counts > 1):
+            yield order[starts[g]:starts[g+1]]
+
+
+def near_pairs(Q, kinds=None, curves=None):
+    # (i, j) pairs, i < j, of rows of Q differing by at most one unit
+    # everywhere (and of the same kind, and with rows of curves differing
+    # by at most 1 everywhere)
+    found = set()
+    for bucket in buckets(Q):
+        bucket = np.sort(bucket)
+        for a in range(len(bucket) - 1):
+            i, rest = bucket[a], bucket[a+1:]
+            close = np.abs(Q[rest].astype(np.int32) - Q[i]).max(axis=1) <= 1
+            if kinds is not None:
+                close &= kinds[rest] == kinds[i]
+            if curves is not None:
+                close &= np.abs(curves[rest] - curves[i]).max(axis=1) <= 1
+            found.update((int(i), int(j)) for j in rest[close])
+    return sorted(found)
+
+
+def find_duplicates(paths, workers=None):
+    # groups (lists of indices into paths) of exact duplicates and of near
+    # duplicates; a near-duplicate group is a connected component of near
+    # pairs, with every exact duplicate of its members
+    signatures = map_chunks(signature, paths, workers)
+    by_hash = {}
+    for i, (digest, q, n2) in enumerate(signatures):
+        if digest is not None:
+            by_hash.setdefault(digest, []).append(i)
+    exact = [g for g in by_hash.values() if len(g) > 1]
+    first = [g[0] for g in by_hash.values() if signatures[g[0]][1] is not None]
+    near = []
+    if len(first) > 1:
+        Q = np.array([signatures[i][1][0] for i in first])
+        curves = np.array([signatures[i][1][1] for i in first])
+        kinds = np.array([signatures[i][2] for i in first])
+        pairs = near_pairs(Q, kinds, curves)
+        members = {i: by_hash[signatures[i][0]] for i in first}
+        near = [sorted(j for i in g for j in members[first[i]])
+                for g in _groups(pairs, len(first))]
+    return exact, near
+
+
+if __name__ == "__main__":
+    import argparse, os, time
+    from dbwalk import scan_data
+    parser = argparse.ArgumentParser(description="""
+                                     Finds exact and near-duplicate data files.
+                                     """)
+    parser.add_argument('database', help='database root directory (database/)')
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    args = parser.parse_args()
+    data_path = os.path.join(args.database, 'data')
+    paths = sorted(scan_data(args.database))
+    t = time.perf_counter()
+    exact, near = find_duplicates([os.path.join(data_path, p) for p in paths], args.jobs)
+    print('{} files, {} exact and {} near-duplicate groups in {:.2f} s'
+          .format(len(paths), len(exact), len(near), time.perf_counter() - t))
+    for title, groups in (('Exact duplicates:', exact), ('Near duplicates:', near)):
+        print(title)
+        for group in groups:
+            print('  ' + ', '.join(paths[i] for i in group))
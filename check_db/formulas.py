@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Evaluation of refractiveindex.info dispersion formulas (types 1-9) for many
+# pages at once, and a sweep that looks for trouble inside the stated range.
+#
+#   n, imaginary = evaluate(2, C, wl)   # C: (pages, 17) coefficients, wl: (pages, samples)
+#   problems = sweep(blocks)            # blocks: [(formula, coefficients, (lo, hi)), ...]
+#
+# Pages are grouped by formula and their coefficients stacked into one
+# zero-padded matrix per formula (missing terms contribute nothing), so a
+# whole group is evaluated by a few array expressions on a (pages x samples)
+# grid spanning each page's own range. The sweep flags non-finite values,
+# imaginary n (n² < 0) or n <= 0, poles of the formula inside the range
+# (found analytically from the coefficients) and discontinuities: a step
+# between neighbouring samples much larger than the steps on either side.
+
+import numpy as np
+
+max_coefficients = 17
+samples = 1000
+jump_factor = 10   # a step this many times both neighbouring steps is a discontinuity
+jump_min = 1e-3    # ... if it is at least this large
+
+
+def _pairs(C, start):
+    # coefficient pairs (C[i], C[i+1]) from index start on, as (pages, m) arrays
+    return C[:, start:-1:2], C[:, start+1::2]
+
+
+def evaluate(formula, C, wl):
+    # n on wl (2-D, one row per page) and where n is imaginary (n² < 0)
+    C = np.asarray(C, float)
+    c = [C[:, i, np.newaxis] for i in range(max_coefficients)]
+    w2 = wl**2
+    n = n2 = None
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        if formula in (1, 2):
+            n2 = 1 + c[0]
+            for i in range(1, max_coefficients - 1, 2):
+                L = c[i+1]**2 if formula == 1 else c[i+1]
+                n2 = n2 + c[i]*w2/(w2 - L)
+        elif formula == 3:
+            n2 = c[0] + sum(c[i]*wl**c[i+1] for i in range(1, max_coefficients - 1, 2))
+        elif formula == 4:
+            # a missing (zero-padded) term would be 0*λ⁰/(λ² - 0⁰), NaN at 1 μm
+            n2 = c[0] + sum(np.where(c[i] == 0, 0, c[i]*wl**c[i+1]/(w2 - c[i+2]**c[i+3]))
+                            for i in (1, 5))
+            for i in range(9, max_coefficients - 1, 2):
+                n2 = n2 + c[i]*wl**c[i+1]
+        elif formula == 5:
+            n = c[0] + sum(c[i]*wl**c[i+1] for i in range(1, max_coefficients - 1, 2))
+        elif formula == 6:
+            n = 1 + c[0] + sum(c[i]/(c[i+1] - 1/w2) for i in range(1, max_coefficients - 1, 2))
+        elif formula == 7:
+            L = 1/(w2 - 0.028)
+            n = c[0] + c[1]*L + c[2]*L**2 + c[3]*w2 + c[4]*w2**2 + c[5]*w2**3
+        elif formula == 8:
+            A = c[0] + c[1]*w2/(w2 - c[2]) + c[3]*w2
+            n2 = (1 + 2*A)/(1 - A)
+        elif formula == 9:
+            n2 = c[0] + c[1]/(w2 - c[2]) + c[3]*(wl - c[4])/((wl - c[4])**2 + c[5])
+        else:
+            raise ValueError('unknown formula {}'.format(formula))
+        if n is None:
+            imaginary = n2 < 0
+            n = np.sqrt(np.where(imaginary, np.nan, n2))
+        else:
+            imaginary = np.zeros(n.shape, bool)
+    return n, imaginary
+
+
+def poles(formula, C):
+    # wavelengths where a term of the formula diverges: (pages, m), NaN if none
+    C = np.asarray(C, float)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        if formula == 1:
+            K, L = _pairs(C, 1)
+            p = np.abs(L)
+        elif formula == 2:
+            K, L = _pairs(C, 1)
+            p = np.sqrt(L)
+        elif formula == 4:
+            K = C[:, [1, 5]]
+            p = np.sqrt(np.column_stack([C[:, 3]**C[:, 4], C[:, 7]**C[:, 8]]))
+        elif formula == 6:
+            K, L = _pairs(C, 1)
+            p = 1/np.sqrt(L)
+        elif formula == 7:
+            K = C[:, 1:3]
+            p = np.full(K.shape, np.sqrt(0.028))
+        elif formula in (8, 9):
+            K = C[:, 1:2]
+            p = np.sqrt(C[:, 2:3])
+            if formula == 9:
+                # (λ - C5)² + C6 = 0 for C6 <= 0
+                root = np.sqrt(-C[:, 5:6])
+                K = np.column_stack([K, C[:, 3:4], C[:, 3:4]])
+                p = np.column_stack([p, C[:, 4:5] - root, C[:, 4:5] + root])
+        else:
+            return np.full((len(C), 0), np.nan)
+    p = np.where((K != 0) & np.isfinite(p) & (p > 0), p, np.nan)
+    return p
+
+
+def check_group(formula, C, lo, hi, samples=samples):
+    # list of problems of every page of one formula group
+    t = np.linspace(0, 1, samples)
+    wl = lo[:, np.newaxis] + (hi - lo)[:, np.newaxis]*t
+    n, imaginary = evaluate(formula, C, wl)
+    problems = [[] for _ in range(len(C))]
+    def report(mask, message):
+        for i in np.flatnonzero(mask.any(axis=1)):
+            problems[i].append(message.format(wl[i][mask[i]][0]))
+    report(imaginary, 'imaginary n at {:.4g} μm')
+    report(~imaginary & ~np.isfinite(n), 'n not finite at {:.4g} μm')
+    report(n <= 0, 'n <= 0 at {:.4g} μm')
+    p = poles(formula, C)
+    with np.errstate(invalid='ignore'):
+        inside = (p >= lo[:, np.newaxis]) & (p <= hi[:, np.newaxis])
+    for i in np.flatnonzero(inside.any(axis=1)):
+        problems[i].append('pole at {:.4g} μm'.format(p[i][inside[i]][0]))
+    with np.errstate(invalid='ignore'):
+        step = np.abs(np.diff(n, axis=1))
+        side = np.pad(step, ((0, 0), (1, 1)), constant_values=0)
+        neighbours = np.fmax(side[:, :-2], side[:, 2:])
+        jump = (step > jump_factor*neighbours) & (step > jump_min)
+    report(np.pad(jump, ((0, 0), (0, 1))), 'discontinuity at {:.4g} μm')
+    return problems
+
+
+def sweep(blocks, samples=samples):
+    # problems of every formula block: blocks are (formula, coefficients,
+    # (lo, hi)) with formula 1-9 and a valid range
+    problems = [None]*len(blocks)
+    groups = {}
+    for i, (formula, coefficients, wl_range) in enumerate(blocks):
+        groups.setdefault(formula, []).append(i)
+    for formula, rows in groups.items():
+        C = np.zeros((len(rows), max_coefficients))
+        for j, i in enumerate(rows):
+            coefficients = blocks[i][1][:max_coefficients]
+            C[j, :len(coefficients)] = coefficients
+        lo, hi = np.array([blocks[i][2] for i in rows], float).reshape(-1, 2).T
+        for i, p in zip(rows, check_group(formula, C, lo, hi, samples)):
+            problems[i] = p
+    return problems
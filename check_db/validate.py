@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# Content checks of refractiveindex.info data files.
+#
+#   messages = check_file('database/data/main/Ag/nk/Johnson.yml')
+#   messages = validate(document)      # an already loaded data file
+#
+# Every DATA block is checked. Tabulated blocks (n, k, nk, n2) are parsed
+# by np.loadtxt in one go (blank lines skipped), which also rejects a line
+# whose column count differs from the others; lines are split one by one only
+# to locate the bad line. Checks: column count, non-numeric values,
+# NaN/inf, wavelengths positive and strictly increasing (repeated wavelengths
+# are reported separately), k >= 0. Formula blocks (types 1-9) are checked
+# for their number of coefficients and a sane range (`wavelength_range`, or
+# `range` as written by older scripts).
+
+import io
+
+import numpy as np
+import yaml
+
+from dbload import load_yaml, map_chunks
+
+# columns of tabulated blocks, the wavelength first
+tabulated_columns = {'tabulated n': ('λ', 'n'), 'tabulated k': ('λ', 'k'),
+                     'tabulated nk': ('λ', 'n', 'k'), 'tabulated n2': ('λ', 'n2')}
+
+
+def coefficient_count_ok(formula, count):
+    # 1, 2, 3, 5, 6: C0 and pairs; 4: C0, two groups of four, then pairs;
+    # 7: up to 6 (Herzberger); 8: 4 (Retro); 9: 6 (Exotic)
+    if formula in (1, 2, 3, 5, 6):
+        return count % 2 == 1 and 3 <= count <= 17
+    if formula == 4:
+        return count == 5 or (count % 2 == 1 and 9 <= count <= 17)
+    if formula == 7:
+        return 1 <= count <= 6
+    if formula == 8:
+        return count == 4
+    if formula == 9:
+        return count == 6
+    return False
+
+
+def parse_table(text, columns):
+    # (rows x columns array, None) or (None, message)
+    if not isinstance(text, str):
+        return None, 'data is not a text block'
+    if not text.strip():
+        return None, 'no data points'
+    try:
+        table = np.loadtxt(io.StringIO(text), float, comments=None, ndmin=2)
+        if table.shape[1] == columns:
+            return table, None
+    except ValueError:
+        pass
+    for lineno, line in enumerate(text.splitlines(), 1):
+        row = line.split()
+        if row and len(row) != columns:
+            return None, 'line {}: {} columns, expected {}'.format(lineno, len(row), columns)
+        try:
+            [float(s) for s in row]
+        except ValueError:
+            return None, 'line {}: not a number: {}'.format(lineno, line.strip())
+    return None, 'not a table of {} columns'.format(columns)
+
+
+def check_table(block):
+    names = tabulated_columns[block['type']]
+    table, error = parse_table(block.get('data'), len(names))
+    if error:
+        return [error]
+    messages = []
+    bad = ~np.isfinite(table)
+    if bad.any():
+        row, column = np.argwhere(bad)[0]
+        messages.append('{} NaN/inf values (first: line {}, {})'
+                        .format(bad.sum(), row + 1, names[column]))
+    wl = table[:, 0]
+    if (wl <= 0).any():
+        messages.append('{} wavelengths <= 0'.format(np.sum(wl <= 0)))
+    step = np.diff(wl)
+    if (step == 0).any():
+        messages.append('repeated wavelength {} (line {})'
+                        .format(wl[1:][step == 0][0], np.flatnonzero(step == 0)[0] + 2))
+    if (step < 0).any():
+        messages.append('wavelengths not increasing at line {}'
+                        .format(np.flatnonzero(step < 0)[0] + 2))
+    if 'k' in names:
+        k = table[:, names.index('k')]
+        if (k < 0).any():
+            messages.append('{} negative k values (first: line {})'
+                            .format(np.sum(k < 0), np.flatnonzero(k < 0)[0] + 1))
+    return messages
+
+
+def wavelength_range(block):
+    # the range of a formula block as two floats, or a message
+    key = 'wavelength_range' if 'wavelength_range' in block else 'range'
+    if key not in block:
+        return None, 'no wavelength_range'
+    try:
+        lo, hi = [float(s) for s in str(block[key]).split()]
+    except ValueError:
+        return None, '{} is not two numbers: {}'.format(key, block[key])
+    if not (np.isfinite(lo) and np.isfinite(hi) and 0 < lo < hi):
+        return None, 'bad {}: {} {}'.format(key, lo, hi)
+    return (lo, hi), None
+
+
+def formula_coefficients(block):
+    # formula number and coefficient array of a formula block, or a message
+    try:
+        formula = int(block['type'].split()[1])
+    except (IndexError, ValueError):
+        return None, None, 'unknown type: ' + block['type']
+    if 'coefficients' not in block:
+        return formula, None, 'no coefficients'
+    try:
+        coefficients = np.array(str(block['coefficients']).split(), float)
+    except ValueError:
+        return formula, None, 'coefficients are not numbers: {}'.format(block['coefficients'])
+    return formula, coefficients, None
+
+
+def check_formula(block):
+    formula, coefficients, error = formula_coefficients(block)
+    if error:
+        return [error]
+    messages = []
+    if not 1 <= formula <= 9:
+        messages.append('unknown formula {}'.format(formula))
+    elif not coefficient_count_ok(formula, len(coefficients)):
+        messages.append('{} coefficients for formula {}'.format(len(coefficients), formula))
+    if not np.isfinite(coefficients).all():
+        messages.append('NaN/inf coefficients')
+    error = wavelength_range(block)[1]
+    if error:
+        messages.append(error)
+    return messages
+
+
+def validate(document):
+    # diagnostics of a loaded data file, empty if it is fine
+    if not isinstance(document, dict) or 'DATA' not in document:
+        return ['no DATA']
+    if not isinstance(document['DATA'], list) or not document['DATA']:
+        return ['DATA is not a list of blocks']
+    messages = []
+    for i, block in enumerate(document['DATA']):
+        if not isinstance(block, dict) or not isinstance(block.get('type'), str):
+            problems = ['block without type']
+        elif block['type'] in tabulated_columns:
+            problems = check_table(block)
+        elif block['type'].startswith('formula'):
+            problems = check_formula(block)
+        else:
+            problems = ['unknown type: {}'.format(block['type'])]
+        label = block.get('type', '?') if isinstance(block, dict) else '?'
+        messages += ['DATA[{}] {}: {}'.format(i, label, p) for p in problems]
+    return messages
+
+
+def check_file(path):
+    # diagnostics of one data file, empty if it is fine
+    try:
+        document = load_yaml(path)
+    except (OSError, yaml.YAMLError, UnicodeDecodeError) as e:
+        return ['{}: {}'.format(type(e).__name__, e)]
+    return validate(document)
+
+
+def check_files(paths, workers=None):
+    return map_chunks(check_file, paths, workers)